@@ -0,0 +1,142 @@
+import numpy as np
+
+
+def column_tops(board):
+    """Return the index of the topmost filled row of every column (height if the column is empty).
+
+    Also works on an (N, height, width) stack, returning an (N, width) array."""
+    filled = board != 0
+    return np.where(filled.any(axis=-2), filled.argmax(axis=-2), board.shape[-2])
+
+
+def drop_row(board, piece, col):
+    """Drop the piece (a PieceRotation) one row at a time from the top, exactly like TetrisAgent.choose_best_move."""
+    height, width = board.shape
+    cells_x = piece.cells_x
+    cells_y = piece.cells_y + col
+    if col + piece.left < 0 or col + piece.right >= width:
+        return -1
+    row = 0
+    while row + piece.height - 1 < height and not board[row + cells_x, cells_y].any():
+        row += 1
+    return row - 1
+
+
+def landing_rows(board, piece, cols, tops=None):
+    """Return the row the piece (a PieceRotation) comes to rest at for every column in cols.
+
+    The landing row is derived from the column-top profile: the piece stops one
+    row above the first row where the lowest cell of one of its columns meets
+    that column's top. cols must lie within piece.columns(width)."""
+    if tops is None:
+        tops = column_tops(board)
+    return landing_rows_many(board[None], piece, cols, tops[None])[0]
+
+
+def landing_rows_many(boards, piece, cols, tops=None):
+    """landing_rows for an (N, height, width) stack of boards, returning an (N, len(cols)) array."""
+    if tops is None:
+        tops = column_tops(boards)
+
+    first_blocked = (tops[:, cols[:, None] + piece.offsets] - piece.bottoms).min(axis=2)
+    rows = first_blocked - 1
+
+    # A piece already blocked at row 0 may still fit lower down through an
+    # overhang; the step-by-step drop finds that spot, so replay it there.
+    for board_index, col_index in zip(*np.nonzero(first_blocked < 0)):
+        rows[board_index, col_index] = drop_row(boards[board_index], piece, cols[col_index])
+    return rows
+
+
+def first_used_row(tops, rows):
+    """Topmost row that is filled, or written by a candidate landing at rows; all rows above it stay empty."""
+    return int(min(max(rows.min(), 0), tops.min()))
+
+
+def build_candidates(board, rotations, crop=False):
+    """Enumerate every placement the agent considers and build all landing boards at once.
+
+    rotations is a list of (presses, PieceRotation), as in
+    tetris_pieces.CANDIDATE_ROTATIONS. Candidates are ordered like
+    TetrisAgent.choose_best_move: rotation-major, then the columns where the
+    piece fits inside the board. Returns (rotations, rows, cols, boards) where
+    boards is an (N, height, width) stack with the piece written in.
+
+    With crop, the empty rows above the stack and every landed piece are
+    left out, so boards only holds the bottom rows: on a tall board with a
+    low stack this saves most of the work. rows still count from the top of
+    the full board."""
+    height, width = board.shape
+    tops = column_tops(board)
+
+    presses, rows, cols, cells_x, cells_y = [], [], [], [], []
+    for rotation_presses, piece in rotations:
+        piece_cols = piece.columns(width)
+        piece_rows = landing_rows(board, piece, piece_cols, tops)
+        presses.append(np.full(len(piece_cols), rotation_presses))
+        rows.append(piece_rows)
+        cols.append(piece_cols)
+        cells_x.append(piece_rows[:, None] + piece.cells_x)
+        cells_y.append(piece_cols[:, None] + piece.cells_y)
+
+    rows = np.concatenate(rows)
+    start = first_used_row(tops, rows) if crop else 0
+    boards = np.repeat(board[None, start:], len(rows), axis=0)
+    write_cells(boards, np.arange(len(rows)), np.concatenate(cells_x) - start, np.concatenate(cells_y))
+    return np.concatenate(presses), rows, np.concatenate(cols), boards
+
+
+def build_candidates_many(boards, rotation_lists, crop=False):
+    """build_candidates for a (K, height, width) stack of boards, each with its own piece.
+
+    rotation_lists[k] is the (presses, PieceRotation) list of game k. Returns
+    (games, rotations, rows, cols, candidates) as flat arrays over all
+    candidates; each game's candidates are contiguous and in search order.
+    Games searching the same rotations are handled together. crop leaves out
+    the rows that are empty in every candidate of every game, as in
+    build_candidates."""
+    num_boards, height, width = boards.shape
+    tops = column_tops(boards)
+
+    groups = {}
+    for index, rotations in enumerate(rotation_lists):
+        groups.setdefault(id(rotations), (rotations, []))[1].append(index)
+
+    games, presses, rows, cols, cells_x, cells_y = [], [], [], [], [], []
+    for rotations, indices in groups.values():
+        group = np.array(indices)
+        group_presses, group_rows, group_cols, group_x, group_y = [], [], [], [], []
+        for rotation_presses, piece in rotations:
+            piece_cols = piece.columns(width)
+            piece_rows = landing_rows_many(boards[group], piece, piece_cols, tops[group])
+            group_presses.append(np.full(len(piece_cols), rotation_presses))
+            group_rows.append(piece_rows)
+            group_cols.append(piece_cols)
+            group_x.append(piece_rows[:, :, None] + piece.cells_x)
+            group_y.append(np.broadcast_to(piece_cols[:, None] + piece.cells_y, group_x[-1].shape))
+
+        # Lay the group out game-major: (games, candidates) flattened
+        count = sum(len(piece_cols) for piece_cols in group_cols)
+        games.append(np.repeat(group, count))
+        presses.append(np.tile(np.concatenate(group_presses), len(group)))
+        rows.append(np.concatenate(group_rows, axis=1).reshape(-1))
+        cols.append(np.tile(np.concatenate(group_cols), len(group)))
+        cells_x.append(np.concatenate(group_x, axis=1).reshape(len(group) * count, -1))
+        cells_y.append(np.concatenate(group_y, axis=1).reshape(len(group) * count, -1))
+
+    games = np.concatenate(games)
+    rows = np.concatenate(rows)
+    start = first_used_row(tops, rows) if crop else 0
+    candidates = boards[games, start:]
+    write_cells(candidates, np.arange(len(rows)), np.concatenate(cells_x) - start, np.concatenate(cells_y))
+    return games, np.concatenate(presses), rows, np.concatenate(cols), candidates
+
+
+def write_cells(boards, indices, cells_x, cells_y):
+    """Set the piece cells that land inside the board; rows above the top (-1) are dropped.
+
+    cells_x and cells_y hold one row of cells per entry of indices."""
+    candidate = np.broadcast_to(indices[:, None], cells_x.shape)
+    inside = cells_x >= 0
+    boards[candidate[inside], cells_x[inside], cells_y[inside]] = 1
+
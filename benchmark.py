@@ -0,0 +1,274 @@
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+from tetris_core import TetrisGame
+from tetris_agent import TetrisAgent
+from run_headless import play_game
+
+PIECE_NAMES = ['I', 'J', 'L', 'O', 'S', 'T', 'Z']
+
+
+def make_board_corpus(seed, count, board_width=10, board_height=20):
+    """Generate a fixed corpus of (board, piece_name) positions.
+
+    Boards are random stacks (uneven column heights with some holes and
+    occasional full rows), so the corpus does not depend on the agent."""
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for _ in range(count):
+        board = np.zeros((board_height, board_width), dtype=int)
+        stack_height = rng.integers(0, int(board_height * 0.7))
+        heights = np.clip(stack_height + rng.integers(-3, 4, size=board_width), 0, board_height - 4)
+        for col, height in enumerate(heights):
+            if height:
+                board[board_height - height:, col] = rng.random(height) > 0.1
+        # Fill a few rows completely so clear_lines has work to do
+        for row in rng.integers(board_height - max(1, stack_height), board_height, size=rng.integers(0, 3)):
+            board[row] = 1
+        corpus.append((board, PIECE_NAMES[rng.integers(len(PIECE_NAMES))]))
+    return corpus
+
+
+def summarize(latencies_ns):
+    """Latency percentiles in microseconds for a list of timings in nanoseconds."""
+    latencies = np.array(latencies_ns, dtype=float) / 1000
+    return {
+        'count': len(latencies),
+        'mean_us': float(latencies.mean()),
+        'p50_us': float(np.percentile(latencies, 50)),
+        'p90_us': float(np.percentile(latencies, 90)),
+        'p99_us': float(np.percentile(latencies, 99)),
+        'max_us': float(latencies.max()),
+    }
+
+
+def bench_step(env, agent, seeds):
+    """Time TetrisGame.step while playing seeded games the way run.py does (without rendering)."""
+    latencies = []
+    for seed in seeds:
+        env.reset(seed=seed)
+        done = False
+        while not done:
+            if env.new_piece_spawned:
+                agent.execute_best_move()
+                env.new_piece_spawned = False
+            start = time.perf_counter_ns()
+            state, done = env.step(-1)
+            latencies.append(time.perf_counter_ns() - start)
+    return summarize(latencies), {}
+
+
+def bench_clear_lines(env, agent, corpus):
+    latencies = []
+    for board, piece_name in corpus:
+        env.load_position(board, piece_name)
+        start = time.perf_counter_ns()
+        env.clear_lines()
+        latencies.append(time.perf_counter_ns() - start)
+    return summarize(latencies), {}
+
+
+def bench_choose_best_move(env, agent, corpus):
+    latencies = []
+    candidates = 0
+    for board, piece_name in corpus:
+        env.load_position(board, piece_name)
+        start = time.perf_counter_ns()
+        agent.choose_best_move()
+        latencies.append(time.perf_counter_ns() - start)
+        candidates += sum(len(piece.columns(env.board_width)) for presses, piece in agent.candidate_rotations())
+    return summarize(latencies), {'moves_per_s': candidates / (sum(latencies) / 1e9),
+                                  'candidates_per_move': candidates / len(corpus)}
+
+
+def bench_evaluate_position(env, agent, corpus):
+    latencies = []
+    for board, piece_name in corpus:
+        env.load_position(board, piece_name)
+        piece = env.current_piece
+        for col in range(env.board_width - piece.shape[1] + 1):
+            start = time.perf_counter_ns()
+            agent.evaluate_position(env.board, piece, [0, col])
+            latencies.append(time.perf_counter_ns() - start)
+    return summarize(latencies), {'moves_per_s': len(latencies) / (sum(latencies) / 1e9)}
+
+
+def bench_games(env, agent, seeds):
+    """Play seeded headless games with env.place, one transition per piece."""
+    latencies = []
+    pieces = 0
+    for seed in seeds:
+        start = time.perf_counter_ns()
+        play_game(agent, seed=seed)
+        latencies.append(time.perf_counter_ns() - start)
+        pieces += env.pieces_placed
+    return summarize(latencies), {'pieces_per_s': pieces / (sum(latencies) / 1e9)}
+
+
+BENCHMARKS = {
+    'step': (bench_step, 'seeds'),
+    'clear_lines': (bench_clear_lines, 'corpus'),
+    'choose_best_move': (bench_choose_best_move, 'corpus'),
+    'evaluate_position': (bench_evaluate_position, 'corpus'),
+    'full_game': (bench_games, 'seeds'),
+}
+
+
+def run_benchmarks(names, board_backend='numpy', agent_backend=None, corpus_size=200, games=5, seed=0,
+                   board_width=10, board_height=20, max_pieces=None):
+    corpus = make_board_corpus(seed, corpus_size, board_width, board_height)
+    seeds = list(range(seed, seed + games))
+    # Games on wide boards can last very long; max_pieces bounds them
+    env = TetrisGame(board_width=board_width, board_height=board_height, backend=board_backend,
+                     max_pieces=max_pieces)
+    agent = TetrisAgent(env, is_debug=False, backend=agent_backend)
+
+    results = {}
+    for name in names:
+        function, inputs = BENCHMARKS[name]
+        data = corpus if inputs == 'corpus' else seeds
+        latency, throughput = function(env, agent, data)
+
+        # Measure allocations on a separate, smaller pass so tracing does not skew the timings
+        tracemalloc.start()
+        function(env, agent, data[:max(1, len(data) // 10)])
+        peak_kib = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+
+        results[name] = {**latency, **throughput, 'peak_alloc_kib': peak_kib}
+        print(format_result(name, results[name]))
+
+    env.close()
+    return {
+        'config': {'board_backend': board_backend, 'agent_backend': agent.backend, 'corpus_size': corpus_size,
+                   'games': games, 'seed': seed, 'board_width': board_width, 'board_height': board_height,
+                   'max_pieces': max_pieces},
+        'environment': {'python': sys.version.split()[0], 'numpy': np.__version__, 'machine': platform.machine()},
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'results': results,
+    }
+
+
+def run_scaling(names, board_sizes, board_backend='numpy', agent_backend=None, corpus_size=200, games=5, seed=0,
+                max_pieces=None):
+    """Run the benchmarks at every (width, height) in board_sizes and print how the costs grow.
+
+    Results are keyed 'name@WxH', so two scaling reports can be compared like single-size ones."""
+    results = {}
+    for width, height in board_sizes:
+        print(f"Board {width}x{height}")
+        report = run_benchmarks(names, board_backend, agent_backend, corpus_size, games, seed, width, height,
+                                max_pieces)
+        for name, result in report['results'].items():
+            results[f'{name}@{width}x{height}'] = result
+
+    print(f"{'board':<10}{'cells':>8}{'candidates/move':>17}{'move p50 us':>13}{'us/candidate':>14}"
+          f"{'pieces/s':>10}")
+    for width, height in board_sizes:
+        search = results.get(f'choose_best_move@{width}x{height}')
+        game = results.get(f'full_game@{width}x{height}')
+        line = f"{f'{width}x{height}':<10}{width * height:>8}"
+        if search is not None:
+            line += (f"{search['candidates_per_move']:>17.1f}{search['p50_us']:>13.1f}"
+                     f"{1e6 / search['moves_per_s']:>14.2f}")
+        else:
+            line += f"{'-':>17}{'-':>13}{'-':>14}"
+        line += f"{game['pieces_per_s']:>10,.0f}" if game is not None else f"{'-':>10}"
+        print(line)
+
+    report['config'].update(board_sizes=[f'{width}x{height}' for width, height in board_sizes])
+    for key in ('board_width', 'board_height'):
+        del report['config'][key]
+    report['results'] = results
+    report['max_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return report
+
+
+def parse_board_size(text):
+    """Parse a WIDTHxHEIGHT board size, e.g. 20x40."""
+    try:
+        width, height = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    if width < 4 or height < 4:
+        raise argparse.ArgumentTypeError(f"board {text} is too small for the pieces (at least 4x4)")
+    return width, height
+
+
+def format_result(name, result):
+    line = (f"{name:<18} p50 {result['p50_us']:>10.1f}us  p90 {result['p90_us']:>10.1f}us  "
+            f"p99 {result['p99_us']:>10.1f}us  peak {result['peak_alloc_kib']:>8.1f}KiB")
+    for key in ('moves_per_s', 'pieces_per_s'):
+        if key in result:
+            line += f"  {key} {result[key]:,.0f}"
+    return line
+
+
+def compare(baseline, current, threshold=0.1):
+    """Print per-benchmark changes between two result files and return the regressed metrics.
+
+    A latency percentile that grows, or a throughput that drops, by more than
+    threshold (a fraction) counts as a regression."""
+    regressions = []
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        for key in ('p50_us', 'p90_us', 'p99_us', 'moves_per_s', 'pieces_per_s'):
+            if key not in new or key not in old or not old[key]:
+                continue
+            change = new[key] / old[key] - 1
+            regressed = change > threshold if key.endswith('_us') else change < -threshold
+            if regressed:
+                regressions.append(f'{name}.{key}')
+            print(f"{name:<18} {key:<13} {old[key]:>14.1f} -> {new[key]:>14.1f}  {change:+7.1%}"
+                  f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Tetris env and agent hot paths.")
+    parser.add_argument('benchmarks', nargs='*', help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--board-backend', choices=['numpy', 'bitboard'], default='numpy')
+    parser.add_argument('--agent-backend', choices=['numpy', 'bitboard', 'batch', 'incremental'], default=None)
+    parser.add_argument('--corpus-size', type=int, default=200, help="positions in the seeded board corpus")
+    parser.add_argument('--games', type=int, default=5, help="seeded games for step and full_game")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--board-sizes', nargs='+', type=parse_board_size, metavar='WxH',
+                        help="run at each of these board sizes (e.g. 10x20 20x40 40x80) and show the scaling")
+    parser.add_argument('--max-pieces', type=int, default=None, help="end benchmark games after this many pieces")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="compare two result files instead of running benchmarks")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change flagged as a regression")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.board_sizes:
+        report = run_scaling(args.benchmarks or list(BENCHMARKS), args.board_sizes, args.board_backend,
+                             args.agent_backend, args.corpus_size, args.games, args.seed, args.max_pieces)
+    else:
+        report = run_benchmarks(args.benchmarks or list(BENCHMARKS), args.board_backend, args.agent_backend,
+                                args.corpus_size, args.games, args.seed, max_pieces=args.max_pieces)
+    print(f"max RSS: {report['max_rss_kib'] / 1024:.1f} MiB")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
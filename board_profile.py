@@ -0,0 +1,99 @@
+import numpy as np
+
+
+class BoardProfile:
+    """Column heights, per-column hole counts and row fill counts of a board.
+
+    TetrisGame keeps one up to date as pieces lock and lines clear, so the
+    agent can score a candidate placement from the handful of columns and
+    rows it touches instead of rescanning the whole board."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.heights = [0] * width
+        self.holes = [0] * width
+        self.row_fill = [0] * height
+
+    @classmethod
+    def from_array(cls, board):
+        """Build the profile of a (height, width) array of 0/1 cells."""
+        height, width = board.shape
+        profile = cls(width, height)
+        filled = np.asarray(board) != 0
+        tops = np.where(filled.any(axis=0), filled.argmax(axis=0), height)
+        covered = np.logical_or.accumulate(filled, axis=0)
+        profile.heights = (height - tops).tolist()
+        profile.holes = (covered & ~filled).sum(axis=0).tolist()
+        profile.row_fill = filled.sum(axis=1).tolist()
+        return profile
+
+    def full_rows(self):
+        return [row for row, count in enumerate(self.row_fill) if count == self.width]
+
+    def add_cells(self, cells):
+        """Update the profile for filling the given (row, col) cells, which must be empty.
+
+        Cells outside the board are ignored, as when locking a piece."""
+        for x, y in cells:
+            if not (0 <= x < self.height and 0 <= y < self.width):
+                continue
+            self.row_fill[x] += 1
+            top = self.height - self.heights[y]
+            if x < top:
+                # The empty cells between the new block and the old top become holes
+                self.holes[y] += top - x - 1
+                self.heights[y] = self.height - x
+            else:
+                self.holes[y] -= 1
+
+    def clear_rows(self, rows, column_cells):
+        """Update the profile for removing the given full rows.
+
+        column_cells(col) must return the column's cells, top to bottom, as
+        they were before the rows were removed. It is only called for columns
+        whose top block is removed."""
+        cleared = set(rows)
+        for col in range(self.width):
+            top = self.height - self.heights[col]
+            if top not in cleared:
+                # All removed rows lie below the top block, and they were full, so no hole moves
+                self.heights[col] -= len(cleared)
+                continue
+            remaining = [cell for row, cell in enumerate(column_cells(col)) if row not in cleared]
+            first = next((row for row, cell in enumerate(remaining) if cell), len(remaining))
+            self.heights[col] = len(remaining) - first
+            self.holes[col] = sum(1 for cell in remaining[first:] if not cell)
+        self.row_fill = [0] * len(cleared) + [count for row, count in enumerate(self.row_fill) if row not in cleared]
+
+    def placement_features(self, cells, is_filled):
+        """Return the effect of filling cells, without changing the profile.
+
+        Returns (new_full_rows, hole_delta, changed_heights) where
+        changed_heights maps each touched column to its new height. Cells
+        outside the board or already filled (is_filled(x, y) is true) are
+        ignored, like when the agent writes a piece onto a copy of the board.
+        Only the touched cells are looked up, so the cost does not grow with
+        the board."""
+        heights = {}
+        holes = {}
+        added = {}
+        for x, y in cells:
+            if not (0 <= x < self.height and 0 <= y < self.width):
+                continue
+            if y not in heights:
+                heights[y] = self.heights[y]
+                holes[y] = self.holes[y]
+            top = self.height - heights[y]
+            if x < top:
+                holes[y] += top - x - 1
+                heights[y] = self.height - x
+            elif is_filled(x, y):
+                continue
+            else:
+                holes[y] -= 1
+            added[x] = added.get(x, 0) + 1
+
+        new_full_rows = sum(1 for x, count in added.items() if self.row_fill[x] + count == self.width)
+        hole_delta = sum(holes[y] - self.holes[y] for y in holes)
+        return new_full_rows, hole_delta, heights
@@ -0,0 +1,193 @@
+import math
+import os
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+import numpy as np
+from game_evaluator import GameEvaluator
+from training_io import load_checkpoint, save_checkpoint
+
+# Summary of the games one weight vector played; ci_low/ci_high bound the mean score.
+# censored counts the games cut short by a cap, whose scores are lower bounds.
+EvaluationStats = namedtuple('EvaluationStats', ['mean', 'variance', 'ci_low', 'ci_high', 'games', 'pieces',
+                                                 'scores', 'seeds', 'censored'])
+
+# How a game's (lines_cleared, pieces_placed) becomes its score. 'lines_per_piece'
+# compares weights fairly when caps stop games at different points (e.g. a
+# time limit on a loaded machine), as it does not grow with game length.
+SCORING = {
+    'lines': lambda lines, pieces: lines,
+    'lines_per_piece': lambda lines, pieces: lines / pieces if pieces else 0.0,
+}
+
+
+@lru_cache(maxsize=None)
+def t_quantile(confidence, df):
+    """Half-width, in standard errors, of a two-sided Student t interval with df degrees of freedom.
+
+    Inverts the closed form of P(|T| < t) for integer df (Abramowitz and
+    Stegun 26.7.3 and 26.7.4) by bisection on theta = atan(t / sqrt(df))."""
+    def coverage(theta):
+        cos = math.cos(theta)
+        term = total = 1.0 if df % 2 == 0 else cos
+        for k in range(2 if df % 2 == 0 else 3, df - 1, 2):
+            term *= (k - 1) / k * cos * cos
+            total += term
+        if df % 2 == 0:
+            return math.sin(theta) * total
+        return 2 / math.pi * (theta + (math.sin(theta) * total if df > 1 else 0.0))
+
+    low, high = 0.0, math.pi / 2
+    for _ in range(60):
+        middle = (low + high) / 2
+        if coverage(middle) < confidence:
+            low = middle
+        else:
+            high = middle
+    return math.sqrt(df) * math.tan((low + high) / 2)
+
+
+def summarize_games(results, seeds, confidence=0.95, scoring='lines'):
+    """Mean, sample variance and a Student t confidence interval of game scores.
+
+    results holds one (lines_cleared, pieces_placed, truncated) per game.
+    One game says nothing about the spread, so its interval is unbounded."""
+    score = SCORING[scoring]
+    scores = np.array([score(lines, pieces) for lines, pieces, truncated in results], dtype=float)
+    mean = float(scores.mean())
+    if len(scores) > 1:
+        variance = float(scores.var(ddof=1))
+        margin = t_quantile(confidence, len(scores) - 1) * math.sqrt(variance / len(scores))
+    else:
+        variance = 0.0
+        margin = math.inf
+    return EvaluationStats(mean, variance, mean - margin, mean + margin, len(scores),
+                           sum(pieces for lines, pieces, truncated in results), scores.tolist(), list(seeds),
+                           sum(1 for lines, pieces, truncated in results if truncated))
+
+
+def overlaps(a, b):
+    """Whether the confidence intervals of two EvaluationStats overlap."""
+    return a.ci_low <= b.ci_high and b.ci_low <= a.ci_high
+
+
+class ResultCache:
+    """Per-game results keyed by (evaluator settings, weights, seed), kept on disk.
+
+    Holds at most max_entries games and evicts the least recently used
+    ones beyond that. The file is written atomically every save_every new
+    results and on close(), so a cache survives between training runs."""
+
+    def __init__(self, path=None, max_entries=100_000, save_every=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.save_every = save_every
+        self.entries = OrderedDict()
+        self.unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.entries = load_checkpoint(path)
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.unsaved += 1
+        if self.unsaved >= self.save_every:
+            self.save()
+
+    def save(self):
+        if self.path is not None and self.unsaved:
+            save_checkpoint(self.path, self.entries)
+        self.unsaved = 0
+
+    def close(self):
+        self.save()
+
+
+class EvaluationService:
+    """Scores weight vectors with statistics, reusing cached games.
+
+    Games already in the cache are not played again, so re-evaluating a
+    weight vector on the same seeds (e.g. the best weights with common
+    seeds) is free. Missing games of all weight vectors are played in one
+    batch by the GameEvaluator, and so in parallel over its workers."""
+
+    def __init__(self, evaluator: GameEvaluator, cache: ResultCache = None, confidence=0.95, batch_games=5,
+                 scoring='lines'):
+        if scoring not in SCORING:
+            raise ValueError(f"Unknown scoring: {scoring!r} (expected one of {', '.join(SCORING)})")
+        self.evaluator = evaluator
+        self.cache = cache if cache is not None else ResultCache()
+        self.confidence = confidence
+        self.scoring = scoring
+        # Games added per round of adaptive sampling
+        self.batch_games = batch_games
+        self.games_played = 0
+
+    def game_key(self, weights, seed):
+        return self.evaluator.config(), tuple(float(weight) for weight in weights), seed
+
+    def play(self, jobs):
+        """Return (lines_cleared, pieces_placed, truncated) for (weights, seed) jobs, playing only uncached games."""
+        keys = [self.game_key(weights, seed) for weights, seed in jobs]
+        results = [self.cache.get(key) for key in keys]
+        missing = [index for index, result in enumerate(results) if result is None]
+        # A job can repeat within a batch; play it once
+        unique = list(OrderedDict((keys[index], index) for index in missing).values())
+        played = dict(zip([keys[index] for index in unique],
+                          self.evaluator.play_games_with_pieces([jobs[index] for index in unique])))
+        self.games_played += len(played)
+        for key, result in played.items():
+            # Where the time limit stops a game depends on the machine, so such games are not reused
+            if result[2] != 'time':
+                self.cache.put(key, result)
+        return [result if result is not None else played[key] for key, result in zip(keys, results)]
+
+    def evaluate(self, population, seeds):
+        """Play every weight vector on all seeds and return an EvaluationStats per vector."""
+        return self.evaluate_prefixes(population, seeds, [len(seeds)] * len(population))
+
+    def evaluate_adaptive(self, population, seeds, min_games, reference=None):
+        """Play each weight vector on a prefix of seeds, long enough to tell it apart from the best.
+
+        Every vector plays min_games first. Then, in rounds, each vector whose
+        confidence interval overlaps that of the best one (the best of the
+        population, or reference if that is better) plays batch_games more
+        seeds, and so does the best one while anything overlaps it, until
+        all seeds are used. Vectors that are clearly worse or clearly better
+        stop early, which saves most games."""
+        counts = [min(min_games, len(seeds))] * len(population)
+        stats = self.evaluate_prefixes(population, seeds, counts)
+        while True:
+            contenders = stats + ([reference] if reference is not None else [])
+            best = max(range(len(contenders)), key=lambda index: contenders[index].mean)
+            growing = [index for index in range(len(stats)) if counts[index] < len(seeds) and any(
+                overlaps(stats[index], contenders[other]) for other in range(len(contenders))
+                if other != index and best in (index, other))]
+            if not growing:
+                return stats
+            for index in growing:
+                counts[index] = min(counts[index] + self.batch_games, len(seeds))
+            stats = self.evaluate_prefixes(population, seeds, counts)
+
+    def evaluate_prefixes(self, population, seeds, counts):
+        """EvaluationStats of each vector on its first counts[i] seeds, played in one batch."""
+        jobs = [(weights, seed) for weights, count in zip(population, counts) for seed in seeds[:count]]
+        results = self.play(jobs)
+        stats = []
+        start = 0
+        for count in counts:
+            stats.append(summarize_games(results[start:start + count], seeds[:count], self.confidence, self.scoring))
+            start += count
+        return stats
@@ -0,0 +1,108 @@
+import multiprocessing
+from tetris_core import TetrisGame
+from tetris_agent import TetrisAgent
+from run_headless import play_game
+from instrumentation import Profiler
+from tetris_features import DEFAULT_FEATURES
+
+# Agent (and profiler, when profiling) owned by each worker process, created once by _init_worker
+_worker_agent = None
+_worker_profiler = None
+
+
+def make_agent(env_kwargs, agent_backend, features=DEFAULT_FEATURES):
+    env = TetrisGame(**env_kwargs)
+    return TetrisAgent(env, is_debug=False, backend=agent_backend, features=features)
+
+
+def play_seeded_game(agent, weights, seed):
+    """Play one headless game with the given weights and piece-sequence seed.
+
+    Returns (lines_cleared, pieces_placed, truncated), truncated naming the
+    cap that ended the game early, or None if the game was lost."""
+    agent.weights = weights
+    return play_game(agent, seed=seed), agent.env.pieces_placed, agent.env.truncated
+
+
+def _init_worker(env_kwargs, agent_backend, features, profile=False):
+    global _worker_agent, _worker_profiler
+    _worker_agent = make_agent(env_kwargs, agent_backend, features)
+    if profile:
+        _worker_profiler = Profiler().attach(_worker_agent.env, _worker_agent)
+
+
+def _play_in_worker(job):
+    weights, seed = job
+    result = play_seeded_game(_worker_agent, weights, seed)
+    if _worker_profiler is None:
+        return result
+    # Ship this job's profile back to be merged, then start afresh
+    state = _worker_profiler.state()
+    _worker_profiler.reset_stats()
+    return result, state
+
+
+class GameEvaluator:
+    """Plays seeded games for weight vectors, in this process or over a process pool.
+
+    A game is fully determined by its weights and seed, so any number of
+    workers returns the same scores as a serial run."""
+
+    def __init__(self, workers=1, board_width=10, board_height=20, backend='bitboard', agent_backend='batch',
+                 randomizer='uniform', max_pieces=None, max_lines=None, time_limit=None, profile=False,
+                 features=DEFAULT_FEATURES):
+        self.workers = workers
+        # Caps keep every game, and so every job, bounded in length
+        self.env_kwargs = {'board_width': board_width, 'board_height': board_height, 'backend': backend,
+                           'randomizer': randomizer, 'max_pieces': max_pieces, 'max_lines': max_lines,
+                           'time_limit': time_limit}
+        self.agent_backend = agent_backend
+        # Features of the agent's evaluator; weight vectors hold one weight per feature
+        self.features = tuple(features)
+        self.agent = None
+        self.pool = None
+        # With profile, self.profiler collects timings of every game, including those played by workers
+        self.profiler = Profiler() if profile else None
+        if profile:
+            self.profiler.processes = workers
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                             initargs=(self.env_kwargs, agent_backend, self.features, profile))
+        else:
+            self.agent = make_agent(self.env_kwargs, agent_backend, self.features)
+            if profile:
+                self.profiler.attach(self.agent.env, self.agent)
+
+    def play_games(self, jobs):
+        """Play a list of (weights, seed) jobs and return their scores in the same order."""
+        return [lines for lines, pieces, truncated in self.play_games_with_pieces(jobs)]
+
+    def play_games_with_pieces(self, jobs):
+        """Like play_games, returning (lines_cleared, pieces_placed, truncated) per game."""
+        if self.pool is None:
+            return [play_seeded_game(self.agent, weights, seed) for weights, seed in jobs]
+        results = self.pool.map(_play_in_worker, jobs, chunksize=1)
+        if self.profiler is None:
+            return results
+        for result, state in results:
+            self.profiler.merge(state)
+        return [result for result, state in results]
+
+    def config(self):
+        """Settings that determine a game's result besides weights and seed, usable as a dict key."""
+        return tuple(sorted(self.env_kwargs.items())) + (('agent_backend', self.agent_backend),
+                                                          ('features', self.features))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.agent is not None:
+            self.agent.env.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
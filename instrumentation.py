@@ -0,0 +1,186 @@
+import time
+
+# Methods timed by Profiler.attach. Calls nest (step calls clear_lines and
+# spawn_piece, choose_best_move calls evaluate_position), so times overlap.
+ENV_METHODS = ['step', 'place', 'lock_piece', 'clear_lines', 'spawn_piece']
+AGENT_METHODS = ['choose_best_move', 'evaluate_position', 'evaluate_position_bitboard', 'score_candidate_boards']
+
+
+class Timing:
+    """Call count, total/min/max time and a log2 histogram of call durations in nanoseconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        # buckets[b] counts calls that took [2**(b-1), 2**b) ns
+        self.buckets = [0] * 64
+
+    def add(self, duration_ns):
+        self.count += 1
+        self.total_ns += duration_ns
+        self.min_ns = duration_ns if self.min_ns is None else min(self.min_ns, duration_ns)
+        self.max_ns = max(self.max_ns, duration_ns)
+        self.buckets[min(duration_ns.bit_length(), 63)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total_ns += other.total_ns
+        if other.min_ns is not None:
+            self.min_ns = other.min_ns if self.min_ns is None else min(self.min_ns, other.min_ns)
+        self.max_ns = max(self.max_ns, other.max_ns)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def percentile_ns(self, fraction):
+        """Upper bound of the histogram bucket holding the given fraction of calls."""
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= fraction * self.count:
+                return min(2 ** bucket, self.max_ns)
+        return 0
+
+
+class Profiler:
+    """Counters, timing histograms and per-game stats for an env and agent.
+
+    attach() wraps the timed methods on those instances only; nothing is
+    wrapped unless a profiler is attached, so disabled runs pay nothing.
+    Games are delimited by env.reset()."""
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.games = []
+        self.game = None
+        self.env = None
+        self.start_time = time.perf_counter()
+        # Processes whose timings are merged in; the time split is relative to all of them
+        self.processes = 1
+
+    def attach(self, env, agent=None):
+        self.env = env
+        for name in ENV_METHODS:
+            self.wrap(env, name)
+        if agent is not None:
+            for name in AGENT_METHODS:
+                self.wrap(agent, name)
+            choose_best_move = agent.choose_best_move
+
+            def count_candidates():
+                candidates = sum(len(piece.columns(env.board_width)) for presses, piece in agent.candidate_rotations())
+                self.count('moves')
+                self.count('candidates', candidates)
+                if self.game is not None:
+                    self.game['moves'] += 1
+                    self.game['candidates'] += candidates
+                return choose_best_move()
+            agent.choose_best_move = count_candidates
+
+        reset = env.reset
+
+        def start_game(*args, **kwargs):
+            self.finish_game()
+            state = reset(*args, **kwargs)
+            self.game = {'moves': 0, 'candidates': 0, 'height_sum': 0, 'max_height': 0,
+                         'start_time': time.perf_counter()}
+            return state
+        env.reset = start_game
+
+        spawn_piece = env.spawn_piece
+
+        def sample_height():
+            # Sampled once per piece, after its lines have been cleared
+            spawn_piece()
+            if self.game is not None:
+                height = max(env.profile.heights)
+                self.game['height_sum'] += height
+                self.game['max_height'] = max(self.game['max_height'], height)
+        env.spawn_piece = sample_height
+        return self
+
+    def wrap(self, obj, name):
+        method = getattr(obj, name)
+        self.timings.setdefault(name, Timing())
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.timings[name].add(time.perf_counter_ns() - start)
+        setattr(obj, name, timed)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def finish_game(self):
+        """Close the current game's stats; called by the next reset() and by summary()."""
+        if self.game is None:
+            return
+        game, self.game = self.game, None
+        pieces = self.env.pieces_placed
+        if not pieces:
+            return
+        self.games.append({
+            'pieces': pieces,
+            'lines': self.env.lines_cleared_count,
+            'seconds': time.perf_counter() - game['start_time'],
+            'candidates_per_move': game['candidates'] / game['moves'] if game['moves'] else 0.0,
+            'mean_stack_height': game['height_sum'] / pieces,
+            'max_stack_height': game['max_height'],
+        })
+        self.count('games')
+        self.count('pieces', pieces)
+        self.count('lines', self.env.lines_cleared_count)
+
+    def state(self):
+        """Everything collected so far, picklable, e.g. to send from a worker process to merge()."""
+        self.finish_game()
+        return {'timings': self.timings, 'counters': self.counters, 'games': self.games}
+
+    def reset_stats(self):
+        self.timings = {name: Timing() for name in self.timings}
+        self.counters = {}
+        self.games = []
+
+    def merge(self, state):
+        for name, timing in state['timings'].items():
+            self.timings.setdefault(name, Timing()).merge(timing)
+        for name, amount in state['counters'].items():
+            self.count(name, amount)
+        self.games.extend(state['games'])
+
+    def summary(self):
+        """Return a printable report: throughput, time split by method and per-game averages."""
+        if self.env is not None:
+            self.finish_game()
+        elapsed = time.perf_counter() - self.start_time
+        lines = [f'Profile over {elapsed:.2f}s wall clock']
+
+        pieces = self.counters.get('pieces', 0)
+        candidates = self.counters.get('candidates', 0)
+        search = self.timings.get('choose_best_move')
+        lines.append(f'  games {self.counters.get("games", 0)} | pieces {pieces} ({pieces / elapsed:,.0f}/s) | '
+                     f'lines {self.counters.get("lines", 0)}')
+        if search is not None and search.total_ns:
+            lines.append(f'  moves {self.counters.get("moves", 0)} | candidates {candidates} '
+                         f'({candidates / (search.total_ns / 1e9):,.0f}/s while searching)')
+
+        lines.append(f'  {"method":<28}{"calls":>10}{"total s":>10}{"share":>8}{"mean us":>10}{"p50 us":>10}'
+                     f'{"p99 us":>10}{"max us":>10}')
+        for name, timing in sorted(self.timings.items(), key=lambda item: -item[1].total_ns):
+            if not timing.count:
+                continue
+            lines.append(f'  {name:<28}{timing.count:>10}{timing.total_ns / 1e9:>10.3f}'
+                         f'{timing.total_ns / 1e9 / (elapsed * self.processes):>8.1%}{timing.total_ns / timing.count / 1e3:>10.1f}'
+                         f'{timing.percentile_ns(0.5) / 1e3:>10.1f}{timing.percentile_ns(0.99) / 1e3:>10.1f}'
+                         f'{timing.max_ns / 1e3:>10.1f}')
+
+        if self.games:
+            averages = {key: sum(game[key] for game in self.games) / len(self.games)
+                        for key in ('pieces', 'lines', 'candidates_per_move', 'mean_stack_height',
+                                    'max_stack_height')}
+            lines.append('  per game: ' + ' | '.join(f'{key} {value:.1f}' for key, value in averages.items()))
+        return '\n'.join(lines)
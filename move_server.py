@@ -0,0 +1,410 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from tetris_core import TetrisGame
+from tetris_agent import TetrisAgent
+from tetris_features import DEFAULT_FEATURES, FEATURES
+from tetris_pieces import PIECES
+from benchmark import make_board_corpus, summarize
+
+# Protocol: newline-delimited JSON over TCP or a Unix socket, any number of
+# requests in flight per connection. A move request
+#   {"id": 7, "board": ["0000000000", ..., "1110111111"], "piece": "T", "rotation": 0}
+# gives the board top row first, as strings of '0'/'1' (or '.'/'#' for
+# empty/filled) or as lists of 0/1,
+# and optionally the piece's current rotation. The reply
+#   {"id": 7, "rotation": 2, "col": 3, "row": 17, "cached": false}
+# holds the rotate presses from that rotation, the column to move the
+# piece's left edge to and the row it lands at, or {"id": 7, "error": "..."}.
+# When the piece cannot land inside the board the game is over, and the
+# reply is {"id": 7, "game_over": true} instead of a move.
+# {"id": 8, "stats": true} replies with the server's counters.
+
+MAX_BOARD_SIDE = 256
+# Longest request line read, enough for the largest board as lists of 0/1 with a space after every separator
+LINE_LIMIT = MAX_BOARD_SIDE * (3 * MAX_BOARD_SIDE + 4) + 4096
+# Cell of each byte of a board row string: 0 empty, 1 filled, -1 not allowed
+CELL_VALUES = np.full(256, -1, dtype=np.int8)
+CELL_VALUES[np.frombuffer(b'0.', dtype=np.uint8)] = 0
+CELL_VALUES[np.frombuffer(b'1#', dtype=np.uint8)] = 1
+
+
+def parse_board(rows):
+    """Turn the board of a request into a (height, width) bool array, raising ValueError if malformed."""
+    if not isinstance(rows, list) or not rows:
+        raise ValueError("board must be a non-empty list of rows")
+    if all(isinstance(row, str) for row in rows):
+        if len(set(map(len, rows))) != 1:
+            raise ValueError("board rows must all have the same length")
+        cells = np.frombuffer(''.join(rows).encode(), dtype=np.uint8)
+        values = CELL_VALUES[cells]
+        if len(cells) != len(rows) * len(rows[0]) or (values < 0).any():
+            raise ValueError("board row strings must only hold '0'/'1' or '.'/'#'")
+        board = (values == 1).reshape(len(rows), -1)
+    else:
+        board = np.array(rows, dtype=object)
+        if board.ndim != 2:
+            raise ValueError("board rows must all have the same length")
+        # Only the integers 0 and 1, as astype(bool) would count a cell like "0" as filled
+        if any(type(cell) is not int for cell in board.flat):
+            raise ValueError("board cells must be the integers 0 or 1")
+        board = board.astype(np.int64)
+        if not np.isin(board, (0, 1)).all():
+            raise ValueError("board cells must be the integers 0 or 1")
+        board = board != 0
+    height, width = board.shape
+    if not (4 <= height <= MAX_BOARD_SIDE and 4 <= width <= MAX_BOARD_SIDE):
+        raise ValueError(f"board must be between 4x4 and {MAX_BOARD_SIDE}x{MAX_BOARD_SIDE}, got {width}x{height}")
+    return board
+
+
+def encode_board(board):
+    """The inverse of parse_board, for clients: rows as strings of '0'/'1'."""
+    board = np.asarray(board)
+    if board.dtype.kind not in 'biu':
+        raise ValueError(f"board must be a bool or integer array, got {board.dtype}")
+    cells = (board != 0).astype(np.uint8) + ord('0')
+    return [row.tobytes().decode() for row in cells]
+
+
+async def read_line(reader):
+    """The next line of a stream opened with limit=LINE_LIMIT, b'' at its end.
+
+    A longer line is skipped to its end and raises ValueError, so the lines
+    after it are still read whole."""
+    too_long = False
+    while True:
+        try:
+            line = await reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError as error:
+            line = error.partial
+        except asyncio.LimitOverrunError as error:
+            # Drop what is buffered of the line and read on to its newline
+            await reader.readexactly(error.consumed)
+            too_long = True
+            continue
+        if too_long:
+            raise ValueError(f"request longer than {LINE_LIMIT} bytes")
+        return line
+
+
+class MoveServer:
+    """Answers best-move queries for boards sent by other programs.
+
+    Requests arriving close together are answered with one batched
+    agent.choose_best_moves call per board size: the first request of a
+    batch waits batch_window seconds for others, and requests keep queueing
+    while a batch is evaluated on the worker thread. Moves are cached by
+    board and piece in an LRU of cache_size entries, so repeated positions
+    are answered without evaluating anything."""
+
+    def __init__(self, agent: TetrisAgent, batch_window=0.0005, max_batch=256, cache_size=100_000):
+        self.agent = agent
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.queue = None
+        # One thread, so batches are evaluated one at a time by the single agent
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='move-server')
+        # evaluate_seconds is the time spent in batched evaluations, the rest goes to I/O and parsing
+        self.stats = {'requests': 0, 'cache_hits': 0, 'errors': 0, 'game_over': 0, 'batches': 0, 'evaluated': 0,
+                      'max_batch': 0, 'evaluate_seconds': 0.0}
+
+    async def serve(self, host='127.0.0.1', port=7777, path=None):
+        """Listen on a Unix socket at path, or on host:port, until cancelled or sent SIGINT/SIGTERM."""
+        loop = asyncio.get_running_loop()
+        serving = asyncio.current_task()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, serving.cancel)
+            except (NotImplementedError, RuntimeError):
+                # Not available on this platform or outside the main thread; Ctrl+C still raises KeyboardInterrupt
+                pass
+
+        self.queue = asyncio.Queue()
+        batcher = asyncio.create_task(self.run_batches())
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path=path, limit=LINE_LIMIT)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port, limit=LINE_LIMIT)
+        try:
+            async with server:
+                print(f"Serving moves on {path or ', '.join(str(sock.getsockname()) for sock in server.sockets)}",
+                      flush=True)
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            batcher.cancel()
+            self.executor.shutdown()
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    async def handle_client(self, reader, writer):
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await read_line(reader)
+                except ValueError as error:
+                    # The request was skipped unread, so its id is unknown
+                    self.stats['errors'] += 1
+                    writer.write(json.dumps({'id': None, 'error': f'ValueError: {error}'}).encode() + b'\n')
+                    await writer.drain()
+                    continue
+                if not line:
+                    break
+                # Answer each request as soon as its batch is done, so replies may come out of order
+                task = asyncio.create_task(self.answer(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def answer(self, line, writer):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            request_id = request.get('id')
+            if request.get('stats'):
+                reply = {'stats': self.summary()}
+            else:
+                reply = await self.best_move(request)
+        except Exception as error:
+            # Malformed requests (and anything else going wrong) get an error reply rather than no reply
+            self.stats['errors'] += 1
+            reply = {'error': f'{type(error).__name__}: {error}'}
+        writer.write(json.dumps({'id': request_id, **reply}).encode() + b'\n')
+        await writer.drain()
+
+    async def best_move(self, request):
+        """Reply to a move request, from the cache or the next batch."""
+        board = parse_board(request['board'])
+        piece = request['piece']
+        if piece not in PIECES:
+            raise ValueError(f"unknown piece {piece!r} (expected one of {', '.join(PIECES)})")
+        rotation = int(request.get('rotation', 0)) % 4
+        self.stats['requests'] += 1
+
+        key = (board.shape, np.packbits(board).tobytes(), piece, rotation)
+        move = self.cache.get(key)
+        if move is not None:
+            self.cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            cached = True
+        else:
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((key, board, piece, rotation, future))
+            move = await future
+            cached = False
+        rotation, col, row = move
+        if row < 0:
+            # The best placement sticks out above the board, so there is no legal landing
+            self.stats['game_over'] += 1
+            return {'game_over': True}
+        return {'rotation': rotation, 'col': col, 'row': row, 'cached': cached}
+
+    async def run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            await asyncio.sleep(self.batch_window)
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            # A position asked for several times in one batch is evaluated once
+            positions = {}
+            for key, board, piece, rotation, future in batch:
+                positions.setdefault(key, (board, piece, rotation))
+            start = time.perf_counter()
+            try:
+                moves = await loop.run_in_executor(self.executor, self.evaluate, positions)
+            except Exception as error:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            self.stats['evaluate_seconds'] += time.perf_counter() - start
+            self.stats['batches'] += 1
+            self.stats['evaluated'] += len(positions)
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(positions))
+            for key, move in moves.items():
+                # Only moves are cached; a position without a legal landing is evaluated again if asked
+                if move[2] >= 0:
+                    self.cache[key] = move
+                    self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            for key, board, piece, rotation, future in batch:
+                if not future.done():
+                    future.set_result(moves[key])
+
+    def evaluate(self, positions):
+        """Best (rotation, col, row) of every position, one choose_best_moves call per board size."""
+        by_shape = {}
+        for key, (board, piece, rotation) in positions.items():
+            by_shape.setdefault(board.shape, []).append(key)
+        moves = {}
+        for keys in by_shape.values():
+            boards = np.stack([positions[key][0] for key in keys]).astype(int)
+            rows, rotations, cols = self.agent.choose_best_moves(
+                boards, [positions[key][1] for key in keys], [positions[key][2] for key in keys])
+            for key, rotation, col, row in zip(keys, rotations.tolist(), cols.tolist(), rows.tolist()):
+                moves[key] = (rotation, col, row)
+        return moves
+
+    def summary(self):
+        stats = dict(self.stats)
+        stats['cache_size'] = len(self.cache)
+        stats['mean_batch'] = stats['evaluated'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+
+class MoveClient:
+    """Asyncio client for a MoveServer; replies are matched to requests by id, so calls can overlap."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.pending = {}
+        self.receiver = asyncio.create_task(self.receive())
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=7777, path=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, **fields):
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.next_id] = future
+        self.writer.write(json.dumps({'id': self.next_id, **fields}).encode() + b'\n')
+        await self.writer.drain()
+        reply = await future
+        if 'error' in reply:
+            raise ValueError(reply['error'])
+        return reply
+
+    async def best_move(self, board, piece, rotation=0):
+        """Return the server's reply for a board (array or encoded rows) and piece."""
+        rows = board if isinstance(board, list) and board and isinstance(board[0], str) else encode_board(board)
+        return await self.request(board=rows, piece=piece, rotation=rotation)
+
+    async def stats(self):
+        return (await self.request(stats=True))['stats']
+
+    async def receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            reply = json.loads(line)
+            future = self.pending.pop(reply['id'], None)
+            if future is not None and not future.done():
+                future.set_result(reply)
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("server closed the connection"))
+
+    async def close(self):
+        self.writer.close()
+        self.receiver.cancel()
+
+
+async def run_load(address, corpus, connections, requests):
+    """Send requests move queries over concurrent connections, each waiting for every reply before the next.
+
+    Connection k cycles through the corpus from its own offset. Returns
+    (latency summary, requests per second, seconds taken, server stats),
+    the stats counting every request the server has answered so far."""
+    clients = [await MoveClient.connect(**address) for _ in range(connections)]
+    encoded = [(encode_board(board), piece) for board, piece in corpus]
+    latencies = []
+
+    async def drive(index, count):
+        client = clients[index]
+        for position in range(count):
+            rows, piece = encoded[(index * len(encoded) // connections + position) % len(encoded)]
+            start = time.perf_counter_ns()
+            await client.best_move(rows, piece)
+            latencies.append(time.perf_counter_ns() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(drive(index, requests // connections + (index < requests % connections))
+                           for index in range(connections)))
+    elapsed = time.perf_counter() - start
+    stats = await clients[0].stats()
+    for client in clients:
+        await client.close()
+    return summarize(latencies), len(latencies) / elapsed, elapsed, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the agent's move choice over a local socket, "
+                                                 "or load-test a running server.")
+    parser.add_argument('mode', choices=['serve', 'bench'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--unix', default=None, help="Unix socket path to use instead of TCP")
+    parser.add_argument('--batch-window', type=float, default=0.5, help="ms a batch waits for more requests")
+    parser.add_argument('--max-batch', type=int, default=256, help="most positions evaluated in one batch")
+    parser.add_argument('--cache-size', type=int, default=100_000, help="moves kept in the cache")
+    parser.add_argument('--features', default=','.join(DEFAULT_FEATURES),
+                        help=f"comma-separated features of the agent's evaluator, from: {', '.join(FEATURES)}")
+    parser.add_argument('--weights', default=None, help="comma-separated weights, one per feature")
+    parser.add_argument('--connections', type=int, default=32, help="bench: concurrent connections")
+    parser.add_argument('--requests', type=int, default=5000, help="bench: move queries to send")
+    parser.add_argument('--corpus-size', type=int, default=1000,
+                        help="bench: distinct positions queried (fewer means more cache hits)")
+    parser.add_argument('--board-width', type=int, default=10, help="bench: board columns")
+    parser.add_argument('--board-height', type=int, default=20, help="bench: board rows")
+    parser.add_argument('--seed', type=int, default=0, help="bench: seed of the position corpus")
+    args = parser.parse_args()
+    address = {'path': args.unix} if args.unix else {'host': args.host, 'port': args.port}
+
+    if args.mode == 'serve':
+        features = [name.strip() for name in args.features.split(',') if name.strip()]
+        unknown = [name for name in features if name not in FEATURES]
+        if unknown or not features:
+            parser.error(f"unknown --features: {', '.join(unknown) or '(none)'}")
+        agent = TetrisAgent(TetrisGame(renderer='none'), backend='batch', features=features)
+        if args.weights is not None:
+            agent.weights = [float(weight) for weight in args.weights.split(',')]
+            if len(agent.weights) != len(features):
+                parser.error(f"--weights needs {len(features)} values, one per feature")
+        server = MoveServer(agent, args.batch_window / 1000, args.max_batch, args.cache_size)
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+        try:
+            asyncio.run(server.serve(**address))
+        except KeyboardInterrupt:
+            pass
+        print(f"Server stats: {server.summary()}")
+    else:
+        corpus = make_board_corpus(args.seed, args.corpus_size, args.board_width, args.board_height)
+        latency, throughput, elapsed, stats = asyncio.run(run_load(address, corpus, args.connections,
+                                                                   args.requests))
+        print(f"{latency['count']} requests over {args.connections} connections | {throughput:,.0f} requests/s")
+        print(f"latency p50 {latency['p50_us']:.0f}us  p90 {latency['p90_us']:.0f}us  "
+              f"p99 {latency['p99_us']:.0f}us  max {latency['max_us']:.0f}us")
+        print(f"server: {stats['requests']} requests, {stats['cache_hits']} cache hits, {stats['batches']} batches "
+              f"(mean {stats['mean_batch']:.1f}, max {stats['max_batch']} positions), "
+              f"{stats['evaluate_seconds']:.2f}s evaluating")
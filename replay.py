@@ -0,0 +1,223 @@
+import argparse
+import os
+import time
+from collections import namedtuple
+import numpy as np
+from tetris_core import TetrisGame
+from tetris_pieces import PIECES
+
+PIECE_NAMES = list(PIECES)
+PIECE_CODES = {name: code for code, name in enumerate(PIECE_NAMES)}
+
+MAGIC = b'TRPL'
+VERSION = 2
+
+# A replay file is a sequence of chunks, each written in one go:
+# a CHUNK_DTYPE header, num_games GAME_DTYPE records, then num_moves MOVE_DTYPE records.
+CHUNK_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u2'), ('board_width', '<u2'), ('board_height', '<u2'),
+                        ('num_games', '<u4'), ('num_moves', '<u8')])
+# first_move indexes the chunk's moves; seeded is 0 when the game was reset without a seed
+GAME_DTYPE = np.dtype([('seed', '<u8'), ('seeded', 'u1'), ('lines_cleared', '<u4'), ('pieces', '<u4'),
+                       ('first_move', '<u8')])
+# Version 1 stored signed seeds
+GAME_DTYPE_V1 = np.dtype([('seed', '<i8'), ('seeded', 'u1'), ('lines_cleared', '<u4'), ('pieces', '<u4'),
+                          ('first_move', '<u8')])
+# One locked piece: PIECE_NAMES index, absolute rotation, landing position and lines it cleared
+MOVE_DTYPE = np.dtype([('piece', 'u1'), ('rotation', 'u1'), ('row', '<i2'), ('col', '<i2'), ('lines', 'u1')])
+
+GameRecord = namedtuple('GameRecord', ['seed', 'lines_cleared', 'moves', 'board_width', 'board_height'])
+
+
+class ReplayWriter:
+    """Records games played on a TetrisGame(recorder=...) into a replay file.
+
+    Moves are buffered in memory and appended to the file as one chunk every
+    flush_every finished games, and on close(). The env passes its board size
+    with every game it begins; the games of a chunk share one size, so a game
+    on another size flushes the buffered ones first."""
+
+    def __init__(self, path, flush_every=1000):
+        self.path = path
+        self.board_width = None
+        self.board_height = None
+        self.flush_every = flush_every
+        self.file = open(path, 'ab')
+        self.games = []
+        self.moves = []
+        self.game = None
+
+    def begin_game(self, seed, board_width, board_height):
+        """Start recording a game on a board_width x board_height board; a game still open is ended first.
+
+        Raises ValueError for a seed the file cannot hold, before any move
+        of the game is buffered, so the other games are still written."""
+        self.end_game()
+        if seed is not None and not (isinstance(seed, (int, np.integer)) and 0 <= seed < 2 ** 64):
+            raise ValueError(f"Cannot record seed {seed!r}: replay seeds are integers in [0, 2**64)")
+        if (board_width, board_height) != (self.board_width, self.board_height):
+            self.flush()
+            self.board_width = board_width
+            self.board_height = board_height
+        self.game = (seed, len(self.moves))
+
+    def record_move(self, piece_name, rotation, row, col, lines_cleared):
+        if self.game is not None:
+            self.moves.append((PIECE_CODES[piece_name], rotation, row, col, lines_cleared))
+
+    def end_game(self):
+        """Finish the open game. A game without moves (e.g. the env's initial reset) is dropped."""
+        if self.game is None:
+            return
+        seed, first_move = self.game
+        moves = self.moves[first_move:]
+        self.game = None
+        if not moves:
+            return
+        lines_cleared = sum(move[-1] for move in moves)
+        self.games.append((0 if seed is None else seed, seed is not None, lines_cleared, len(moves), first_move))
+        if len(self.games) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Append the finished games as one chunk. Moves of an open game stay buffered."""
+        if not self.games:
+            return
+        open_moves = self.moves[self.game[1]:] if self.game is not None else []
+        num_moves = len(self.moves) - len(open_moves)
+        header = np.array([(MAGIC, VERSION, self.board_width, self.board_height, len(self.games), num_moves)],
+                          dtype=CHUNK_DTYPE)
+        self.file.write(header.tobytes())
+        self.file.write(np.array(self.games, dtype=GAME_DTYPE).tobytes())
+        self.file.write(np.array(self.moves[:num_moves], dtype=MOVE_DTYPE).tobytes())
+        self.file.flush()
+
+        self.games = []
+        self.moves = open_moves
+        if self.game is not None:
+            self.game = (self.game[0], 0)
+
+    def close(self):
+        """End any open game, write everything buffered and close the file."""
+        self.end_game()
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReplayFile:
+    """Read-only view of a replay file, memory-mapped so large files load instantly.
+
+    replays[i] returns game i as a GameRecord whose moves are a MOVE_DTYPE
+    array backed by the mapping. The per-game lines_cleared, pieces and seeds
+    arrays make it cheap to find the games worth replaying."""
+
+    def __init__(self, path):
+        self.path = path
+        # An empty file cannot be mapped, and has no games anyway
+        data = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, np.uint8)
+        self.chunks = []
+        offset = 0
+        while offset < len(data):
+            header = np.frombuffer(data, CHUNK_DTYPE, 1, offset)[0]
+            if header['magic'] != MAGIC or header['version'] not in (1, VERSION):
+                raise ValueError(f"{path}: not a replay file (or unsupported version) at byte {offset}")
+            offset += CHUNK_DTYPE.itemsize
+            if header['version'] == 1:
+                old_games = np.frombuffer(data, GAME_DTYPE_V1, int(header['num_games']), offset)
+                offset += old_games.nbytes
+                games = np.zeros(len(old_games), GAME_DTYPE)
+                for name in GAME_DTYPE.names:
+                    games[name] = old_games[name]
+                # random.seed(n) seeds the same sequence as abs(n)
+                games['seed'] = np.abs(old_games['seed'])
+            else:
+                games = np.frombuffer(data, GAME_DTYPE, int(header['num_games']), offset)
+                offset += games.nbytes
+            moves = np.frombuffer(data, MOVE_DTYPE, int(header['num_moves']), offset)
+            offset += moves.nbytes
+            self.chunks.append((int(header['board_width']), int(header['board_height']), games, moves))
+
+        games = np.concatenate([chunk[2] for chunk in self.chunks] + [np.zeros(0, GAME_DTYPE)])
+        self.lines_cleared = games['lines_cleared']
+        self.pieces = games['pieces']
+        # The seeds of games played without one are 0; seeded tells them apart
+        self.seeds = games['seed']
+        self.seeded = games['seeded'] != 0
+        self.chunk_starts = np.cumsum([0] + [len(chunk[2]) for chunk in self.chunks])
+
+    def __len__(self):
+        return int(self.chunk_starts[-1])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        chunk = int(np.searchsorted(self.chunk_starts, index, side='right')) - 1
+        board_width, board_height, games, moves = self.chunks[chunk]
+        game = games[index - self.chunk_starts[chunk]]
+        first_move = int(game['first_move'])
+        return GameRecord(int(game['seed']) if game['seeded'] else None, int(game['lines_cleared']),
+                          moves[first_move:first_move + int(game['pieces'])], board_width, board_height)
+
+
+def replay_game(record, env=None, render=False, delay=0.0):
+    """Play a recorded game back on env (a new headless TetrisGame by default).
+
+    Each recorded piece is locked at its recorded rotation and position, so
+    no agent and no piece RNG is involved. With render, every placement is
+    drawn and delay seconds pass between them. Returns the env in its final
+    state; raises ValueError if the lines cleared differ from the record."""
+    if env is None:
+        env = TetrisGame(record.board_width, record.board_height, renderer='pygame' if render else 'none')
+    env.reset(record.seed)
+
+    moves = record.moves
+    for index, move in enumerate(moves):
+        env.set_current_piece(PIECE_NAMES[move['piece']])
+        env.next_piece_name = PIECE_NAMES[moves[index + 1]['piece']] if index + 1 < len(moves) else None
+        env.current_rotation = int(move['rotation'])
+        env.current_piece = env.current_piece_rotation().array
+        env.current_position = [int(move['row']), int(move['col'])]
+        if render:
+            env.render()
+            time.sleep(delay)
+
+        env.lock_piece()
+        lines_cleared = env.clear_lines()
+        if lines_cleared != move['lines']:
+            raise ValueError(f"Replay diverged at piece {index}: {lines_cleared} lines cleared, "
+                             f"recorded {move['lines']}")
+
+    if render:
+        env.render()
+    if env.lines_cleared_count != record.lines_cleared:
+        raise ValueError(f"Replay cleared {env.lines_cleared_count} lines, recorded {record.lines_cleared}")
+    return env
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and replay recorded Tetris games.")
+    parser.add_argument('path', help="replay file written with --record")
+    parser.add_argument('--worst', type=int, default=10, help="list this many lowest-scoring games")
+    parser.add_argument('--game', type=int, default=None, help="replay this game")
+    parser.add_argument('--render', action='store_true', help="draw the replayed game")
+    parser.add_argument('--delay', type=float, default=0.05, help="seconds between pieces when rendering")
+    args = parser.parse_args()
+
+    replays = ReplayFile(args.path)
+    if args.game is None:
+        print(f'{len(replays)} games | average score: {replays.lines_cleared.mean():.1f}')
+        for index in np.argsort(replays.lines_cleared, kind='stable')[:args.worst]:
+            print(f'Game {index} | Score: {replays.lines_cleared[index]} | Pieces: {replays.pieces[index]} '
+                  f'| Seed: {replays.seeds[index] if replays.seeded[index] else None}')
+    else:
+        start = time.perf_counter()
+        env = replay_game(replays[args.game], render=args.render, delay=args.delay)
+        print(f'Game {args.game} | Score: {env.lines_cleared_count} | {time.perf_counter() - start:.2f}s')
+        env.close()
@@ -1,20 +1,40 @@
+import argparse
 from tetris_env import TetrisEnv
 from tetris_agent import TetrisAgent
+from instrumentation import Profiler
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch the Tetris agent play.")
+    parser.add_argument('--max-pieces', type=int, default=None, help="end a game after this many pieces")
+    parser.add_argument('--max-lines', type=int, default=None, help="end a game after this many lines")
+    parser.add_argument('--time-limit', type=float, default=None, help="end a game after this many seconds")
+    parser.add_argument('--profile', action='store_true', help="time the env and agent and print a summary")
+    args = parser.parse_args()
+
     full_games = 100
 
-    for i in range(full_games):
-        env = TetrisEnv(time_delay=0.01)
-        agent = TetrisAgent(env, is_debug=False)
-        done = False
-        state = env.reset()
-        while not done:
-            env.render()
-            if env.new_piece_spawned:
-                agent.execute_best_move(render=True)
-                env.new_piece_spawned = False
-            state, done = env.step(-1)
-        print(f'Game: ({i} / {full_games}) | Score: {env.lines_cleared_count}')
-    
-    env.close()
\ No newline at end of file
+    # One env for all games, so they are drawn by the same renderer window
+    env = TetrisEnv(time_delay=0.01, max_pieces=args.max_pieces, max_lines=args.max_lines, time_limit=args.time_limit)
+    agent = TetrisAgent(env, is_debug=False)
+    profiler = Profiler().attach(env, agent) if args.profile else None
+
+    try:
+        for i in range(full_games):
+            done = False
+            state = env.reset()
+            while not done:
+                env.render()
+                if env.new_piece_spawned:
+                    # The agent's moves can end the game too, e.g. when a cap is reached
+                    done = agent.execute_best_move(render=True)
+                    env.new_piece_spawned = False
+                if not done:
+                    state, done = env.step(-1)
+            censored = f' (stopped by the {env.truncated} cap)' if env.truncated else ''
+            print(f'Game: ({i} / {full_games}) | Score: {env.lines_cleared_count} | Pieces: {env.pieces_placed}{censored}')
+    finally:
+        # Also print the summary when the run is stopped with Ctrl+C
+        if profiler is not None:
+            print(profiler.summary())
+
+    env.close()
@@ -0,0 +1,63 @@
+import argparse
+import time
+from tetris_core import TetrisGame
+from tetris_agent import TetrisAgent
+from replay import ReplayWriter
+from instrumentation import Profiler
+
+
+def play_game(agent: TetrisAgent, seed=None):
+    """Play one game without rendering, one env.place transition per piece.
+
+    Returns the number of lines cleared; env.truncated tells whether the game
+    was cut short by one of the env's caps, making it a censored score."""
+    agent.env.reset(seed=seed)
+    done = False
+    while not done:
+        done = agent.place_best_move()
+    return agent.env.lines_cleared_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Tetris agent headlessly at full speed.")
+    parser.add_argument('--games', type=int, default=100, help="number of games to play")
+    parser.add_argument('--board-width', type=int, default=10, help="board columns")
+    parser.add_argument('--board-height', type=int, default=20, help="board rows")
+    parser.add_argument('--board-backend', choices=['numpy', 'bitboard'], default='bitboard',
+                        help="board representation used by the env")
+    parser.add_argument('--agent-backend', choices=['numpy', 'bitboard', 'batch', 'incremental'], default=None,
+                        help="move search used by the agent (defaults to the board backend)")
+    parser.add_argument('--lookahead', action='store_true', help="also search placements of the next piece")
+    parser.add_argument('--beam-width', type=int, default=8, help="first placements expanded by the lookahead")
+    parser.add_argument('--time-budget', type=float, default=None, help="lookahead time limit per move in seconds")
+    parser.add_argument('--randomizer', choices=['uniform', 'bag'], default='uniform', help="piece randomizer")
+    parser.add_argument('--seed', type=int, default=None, help="game i is played with seed + i")
+    parser.add_argument('--record', default=None, help="append every game to this replay file")
+    parser.add_argument('--max-pieces', type=int, default=None, help="end a game after this many pieces")
+    parser.add_argument('--max-lines', type=int, default=None, help="end a game after this many lines")
+    parser.add_argument('--time-limit', type=float, default=None, help="end a game after this many seconds")
+    parser.add_argument('--profile', action='store_true', help="time the env and agent and print a summary")
+    args = parser.parse_args()
+
+    recorder = ReplayWriter(args.record) if args.record else None
+    env = TetrisGame(args.board_width, args.board_height, backend=args.board_backend, randomizer=args.randomizer, recorder=recorder,
+                     max_pieces=args.max_pieces, max_lines=args.max_lines, time_limit=args.time_limit)
+    agent = TetrisAgent(env, is_debug=False, backend=args.agent_backend, lookahead=args.lookahead,
+                        beam_width=args.beam_width, time_budget=args.time_budget)
+    profiler = Profiler().attach(env, agent) if args.profile else None
+
+    start = time.perf_counter()
+    total_score = 0
+    for i in range(args.games):
+        score = play_game(agent, seed=None if args.seed is None else args.seed + i)
+        total_score += score
+        censored = f' (stopped by the {env.truncated} cap)' if env.truncated else ''
+        print(f'Game: ({i} / {args.games}) | Score: {score} | Pieces: {env.pieces_placed}{censored}')
+
+    elapsed = time.perf_counter() - start
+    print(f'Average score: {total_score / args.games} | {elapsed:.2f}s')
+    if profiler is not None:
+        print(profiler.summary())
+    env.close()
+    if recorder is not None:
+        recorder.close()
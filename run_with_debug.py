@@ -4,9 +4,11 @@ from tetris_agent import TetrisAgent
 if __name__ == "__main__":
     full_games = 100
 
+    # One env for all games, so they are drawn by the same renderer window
+    env = TetrisEnv(time_delay=0.02)
+    agent = TetrisAgent(env, is_debug=True)
+
     for i in range(full_games):
-        env = TetrisEnv(time_delay=0.02)
-        agent = TetrisAgent(env, is_debug=True)
         done = False
         state = env.reset()
         while not done:
@@ -1,12 +1,42 @@
 import numpy as np
-from tetris_env import TetrisEnv
+from tetris_core import TetrisGame
+from tetris_bitboard import BitBoard
+from tetris_pieces import CANDIDATE_ROTATIONS
+from tetris_features import DEFAULT_FEATURES, LinearEvaluator, default_weights
+import batch_evaluator
 import os
+import time
 
 class TetrisAgent:
-    def __init__(self, env: TetrisEnv, is_debug: bool = False):
-        self.env: TetrisEnv = env
+    def __init__(self, env: TetrisGame, is_debug: bool = False, backend: str = None, lookahead: bool = False,
+                 beam_width: int = 8, time_budget: float = None, cache_size: int = 100_000,
+                 features=DEFAULT_FEATURES):
+        self.env: TetrisGame = env
         self.is_debug = is_debug
-        self.weights = [0.42657453, 1.17615849, -0.0422209, -0.82640537]
+        # Candidate boards are scored by a linear evaluator over the selected
+        # tetris_features; weights holds one weight per feature, in order.
+        # The numpy, bitboard and incremental searches compute the four
+        # default features directly, so other feature sets are always
+        # searched with the batch backend.
+        self.evaluator = LinearEvaluator(features)
+        self.weights = default_weights(self.evaluator.features)
+        # Move search backend, defaults to the env's board backend.
+        # 'batch' scores all candidates of a move in one vectorized pass,
+        # 'incremental' derives them from the env's cached board profile.
+        self.backend = backend or env.backend
+        if self.backend not in ('numpy', 'bitboard', 'batch', 'incremental'):
+            raise ValueError(f"Unknown backend: {self.backend!r} "
+                             "(expected 'numpy', 'bitboard', 'batch' or 'incremental')")
+
+        # Two-piece lookahead using the env's next-piece preview: the best
+        # beam_width first placements are expanded with every placement of the
+        # next piece, within time_budget seconds per move when set.
+        self.lookahead = lookahead
+        self.beam_width = beam_width
+        self.time_budget = time_budget
+        # Transposition table: (board after clearing, piece, weights) -> best reward for that piece
+        self.cache_size = cache_size
+        self.transpositions = {}
 
     def evaluate_position(self, board, piece, position):
         """Evaluate a specific position and return a score based on normalized reward criteria."""
@@ -26,23 +56,8 @@ class TetrisAgent:
         holes = self.count_holes(temp_board)
         height = temp_position[0]
         empty_pillars = self.count_empty_pillars(temp_board)
-        
-        # Normalize the reward components
-        normalized_lines_cleared = min(lines_cleared / 4, 1)  # Assume max 4 lines can be cleared at once
-        normalized_holes = min(holes / (self.env.board_width * self.env.board_height), 1)  # Max possible holes
-        normalized_height = height / self.env.board_height  # Normalize height to a range of [0, 1]
-        empty_pillars_penalty = min(empty_pillars / 5, 1) if empty_pillars >= 2 else 0 # normalize if empty pillars is more than 2
 
-
-
-
-        # Reward function with normalized components
-        reward = (
-            (normalized_lines_cleared ** 2) * self.weights[0]
-            - normalized_holes * self.weights[1]
-            - (normalized_height ** 2) * self.weights[2]
-            + empty_pillars_penalty * self.weights[3]
-        )
+        reward = self.compute_reward(lines_cleared, holes, height, empty_pillars)
 
         # print(self.env.current_piece_name)
         if self.env.current_piece_name == 'L' or self.env.current_piece_name == 'J':
@@ -55,6 +70,58 @@ class TetrisAgent:
                 pass
         return reward
 
+    def compute_reward(self, lines_cleared, holes, height, empty_pillars):
+        """Combine the raw reward criteria into a single weighted score."""
+        # Normalize the reward components
+        normalized_lines_cleared = min(lines_cleared / 4, 1)  # Assume max 4 lines can be cleared at once
+        normalized_holes = min(holes / (self.env.board_width * self.env.board_height), 1)  # Max possible holes
+        normalized_height = height / self.env.board_height  # Normalize height to a range of [0, 1]
+        # Pillars are counted relative to the board width (at least 2, normalized by 5, on the standard 10 columns)
+        pillar_scale = self.env.board_width / 10
+        empty_pillars_penalty = min(empty_pillars / (5 * pillar_scale), 1) if empty_pillars >= 2 * pillar_scale else 0
+
+        # Reward function with normalized components
+        return (
+            (normalized_lines_cleared ** 2) * self.weights[0]
+            - normalized_holes * self.weights[1]
+            - (normalized_height ** 2) * self.weights[2]
+            + empty_pillars_penalty * self.weights[3]
+        )
+
+    def candidate_rotations(self, piece_name=None, rotation=0):
+        """Distinct rotations to search, as (presses, PieceRotation), defaulting to the env's current piece."""
+        if piece_name is None:
+            piece_name, rotation = self.env.current_piece_name, self.env.current_rotation
+        return CANDIDATE_ROTATIONS[piece_name][rotation]
+
+    def evaluate_positions_batch(self, board, rotations):
+        """Score every candidate placement of the given (presses, PieceRotation) list at once.
+
+        Returns (rotations, rows, cols, scores) in choose_best_move's search order."""
+        rotations, rows, cols, boards = batch_evaluator.build_candidates(board, rotations, crop=True)
+        return rotations, rows, cols, self.score_candidate_boards(boards, rows, board.shape[0])
+
+    def score_candidate_boards(self, boards, rows, board_height=None):
+        """Score a stack of candidate boards (piece written in, lines not cleared) landed at rows.
+
+        board_height is the height of the full boards when the stack was cropped."""
+        # As in evaluate_position_bitboard, the never-firing L/J rule is omitted
+        return self.evaluator.score(boards, rows, self.weights, board_height)
+
+    def evaluate_position_bitboard(self, board: BitBoard, piece_masks, position):
+        """Bitboard version of evaluate_position, taking the piece as PieceMasks."""
+        temp_board = board.copy()
+        temp_board.lock(piece_masks, position[0], position[1])
+
+        lines_cleared = temp_board.count_full_lines()
+        holes = temp_board.count_holes()
+        empty_pillars = self.count_pillars_from_heights(temp_board.column_heights())
+
+        # The L/J special case in evaluate_position never fires (comparing the
+        # piece array with a nested list raises and is swallowed), so it has
+        # no counterpart here.
+        return self.compute_reward(lines_cleared, holes, position[0], empty_pillars)
+
     def count_cleared_lines(self, board):
         """Count how many lines would be cleared in this board state."""
         return sum(np.all(row) for row in board)
@@ -73,47 +140,62 @@ class TetrisAgent:
 
     def count_empty_pillars(self, board):
         """Count columns that have adjacent columns with at least 3 rows higher, indicating an empty pillar."""
-        empty_pillars = 0
-
         # Calculate heights of each column
         column_heights = []
         for col in range(board.shape[1]):
             height = next((row for row in range(board.shape[0]) if board[row, col] != 0), board.shape[0])
             column_heights.append(board.shape[0] - height)
 
+        return self.count_pillars_from_heights(column_heights)
+
+    def count_pillars_from_heights(self, column_heights):
+        """Count empty pillars given the height of every column."""
+        return sum(self.pillar_flags(column_heights))
+
+    def pillar_flags(self, column_heights):
+        """Return, per column, 1 if it is an empty pillar (a neighbour at least 3 rows higher), else 0."""
+        flags = []
+        width = len(column_heights)
+
         # Check for empty pillars based on adjacent column heights
-        for col in range(board.shape[1]):
+        for col in range(width):
             current_height = column_heights[col]
 
             # Check if the left neighbor exists
             if col > 0 and column_heights[col - 1] - current_height >= 3:
-                empty_pillars += 1
+                flags.append(1)
                 continue  # No need to check the right neighbor if already identified as empty
 
             # Check the right neighbor if it exists
-            if col < board.shape[1] - 1 and column_heights[col + 1] - current_height >= 3:
-                empty_pillars += 1
+            if col < width - 1 and column_heights[col + 1] - current_height >= 3:
+                flags.append(1)
+                continue
+
+            flags.append(0)
 
-        return empty_pillars
+        return flags
 
     def choose_best_move(self):
         """Evaluate all possible positions for the current piece and choose the best one."""
+        if self.lookahead and self.env.next_piece_name is not None:
+            return self.choose_best_move_lookahead()
+        if self.backend == 'batch' or self.evaluator.features != DEFAULT_FEATURES:
+            return self.choose_best_move_batch()
+        if self.backend == 'bitboard':
+            return self.choose_best_move_bitboard()
+        if self.backend == 'incremental':
+            return self.choose_best_move_incremental()
+
         best_score = -float('inf')
         best_position = None
         best_rotation = 0
 
-        # Get the current piece in stable 4x4 grid
-        initial_piece = self.env.current_piece.copy()
-        initial_position = self.env.current_piece.copy()
+        # Explore the distinct rotations (0, 90, 180, 270 degrees, minus repeated shapes)
+        for rotation, piece_rotation in self.candidate_rotations():
+            piece = piece_rotation.array
 
-        # Explore all rotations (0, 90, 180, 270 degrees)
-        for rotation in range(4):
-            piece = np.rot90(initial_piece.copy(), -rotation)
-
-            piece_width = piece.shape[1]
-
-            # Try each column position where the piece could land
-            for col in range(-1, self.env.board_width):
+            # Try each column position where the piece lies inside the board
+            for col in piece_rotation.columns(self.env.board_width).tolist():
                 # Drop the piece to the bottom in this column
                 row = 0
                 while self.is_valid_position(piece, (row, col)):
@@ -132,6 +214,181 @@ class TetrisAgent:
         # Return the best position and rotation
         return best_position, best_rotation
 
+    def choose_best_move_bitboard(self):
+        """Same search as choose_best_move, using bitboard collision tests and features."""
+        best_score = -float('inf')
+        best_position = None
+        best_rotation = 0
+
+        board = self.env.bitboard if self.env.bitboard is not None else BitBoard.from_array(self.env.board)
+
+        for rotation, piece_rotation in self.candidate_rotations():
+            piece_masks = piece_rotation.masks
+
+            for col in piece_rotation.columns(self.env.board_width).tolist():
+                row = board.drop_row(piece_masks, col)
+
+                score = self.evaluate_position_bitboard(board, piece_masks, [row, col])
+                if self.is_debug:
+                    self.env.render(given_piece=piece_rotation.array, given_position=[row, col])
+                if score > best_score:
+                    best_score = score
+                    best_position = [row, col]
+                    best_rotation = rotation
+
+        return best_position, best_rotation
+
+    def choose_best_move_batch(self):
+        """Same search as choose_best_move, scoring all candidates in one vectorized pass."""
+        rotations, rows, cols, scores = self.evaluate_positions_batch(self.env.board, self.candidate_rotations())
+        if self.is_debug:
+            pieces = dict(self.candidate_rotations())
+            for rotation, row, col in zip(rotations, rows, cols):
+                self.env.render(given_piece=pieces[rotation].array, given_position=[row, col])
+
+        # argmax keeps the first of equal scores, like the strict > in choose_best_move
+        best = int(np.argmax(scores))
+        return [int(rows[best]), int(cols[best])], int(rotations[best])
+
+    def choose_best_moves(self, boards, piece_names, piece_rotations=None):
+        """Choose moves for K games at once, e.g. the boards of a VectorTetrisEnv.
+
+        All candidates of all games are scored in one batched evaluation. Returns
+        (rows, rotations, cols) arrays; each game's choice is the one
+        choose_best_move would make on that board. Pieces are unrotated unless
+        piece_rotations gives each one's current rotation; the returned
+        rotations are rotate presses from there. Only the boards' own size
+        matters, not the env's."""
+        if piece_rotations is None:
+            piece_rotations = [0] * len(piece_names)
+        games, rotations, rows, cols, candidates = batch_evaluator.build_candidates_many(
+            boards, [self.candidate_rotations(name, rotation) for name, rotation in zip(piece_names, piece_rotations)],
+            crop=True)
+        scores = self.score_candidate_boards(candidates, rows, boards.shape[1])
+        # Sort by game, then best score first; lexsort is stable, so among
+        # equal scores the first in search order wins, like argmax
+        order = np.lexsort((-scores, games))
+        best = order[np.unique(games[order], return_index=True)[1]]
+        return rows[best], rotations[best], cols[best]
+
+    def best_reward(self, board, piece_name):
+        """Best reward of any placement of piece_name on board, memoized in the transposition table.
+
+        The weights are part of the key, as they are reassigned on long-lived
+        agents (e.g. by GameEvaluator) and rewards under old weights must not be reused."""
+        key = (board.shape, np.packbits(board != 0).tobytes(), piece_name, tuple(self.weights))
+        reward = self.transpositions.get(key)
+        if reward is None:
+            rotations, rows, cols, scores = self.evaluate_positions_batch(board, self.candidate_rotations(piece_name))
+            reward = float(scores.max())
+            if len(self.transpositions) >= self.cache_size:
+                self.transpositions.clear()
+            self.transpositions[key] = reward
+        return reward
+
+    def choose_best_move_lookahead(self):
+        """Two-piece search: current piece, then the previewed next piece.
+
+        Candidates are ranked greedily first; the best beam_width distinct
+        resulting boards are expanded with the next piece and scored by the sum
+        of both rewards. When time_budget runs out, the best expanded candidate
+        so far is used (or the greedy best if none were expanded)."""
+        start = time.perf_counter()
+        candidate_rotations = self.candidate_rotations()
+        rotations, rows, cols, boards = batch_evaluator.build_candidates(self.env.board, candidate_rotations)
+        scores = self.score_candidate_boards(boards, rows)
+
+        order = np.argsort(-scores, kind='stable')
+        best = int(order[0])
+        best_value = -float('inf')
+        expanded = set()
+        for index in order:
+            if len(expanded) >= self.beam_width:
+                break
+            if self.time_budget is not None and time.perf_counter() - start > self.time_budget:
+                break
+
+            # Clear full lines, as the env will before the next piece spawns
+            board = boards[index]
+            kept = board[~(board != 0).all(axis=1)]
+            board = np.concatenate([np.zeros((board.shape[0] - len(kept), board.shape[1]), dtype=board.dtype), kept])
+
+            # Skip placements that lead to a board already expanded this move
+            key = np.packbits(board != 0).tobytes()
+            if key in expanded:
+                continue
+            expanded.add(key)
+
+            value = scores[index] + self.best_reward(board, self.env.next_piece_name)
+            if self.is_debug:
+                self.env.render(given_piece=dict(candidate_rotations)[rotations[index]].array,
+                                given_position=[rows[index], cols[index]])
+            if value > best_value:
+                best_value = value
+                best = int(index)
+
+        return [int(rows[best]), int(cols[best])], int(rotations[best])
+
+    def choose_best_move_incremental(self):
+        """Same search as choose_best_move, scoring candidates as deltas from env.profile.
+
+        Only the rows and columns under the piece are looked at, so each
+        candidate costs O(piece size) instead of a scan of the whole board,
+        and the board array is never built: cells are read through the env.
+        This makes it the backend of choice for large boards."""
+        best_score = -float('inf')
+        best_position = None
+        best_rotation = 0
+
+        profile = self.env.profile
+        is_filled = self.env.is_filled
+        board_height = self.env.board_height
+        board_width = self.env.board_width
+        heights = profile.heights
+        tops = [board_height - height for height in heights]
+        base_lines = len(profile.full_rows())
+        base_holes = sum(profile.holes)
+        base_pillars = self.pillar_flags(profile.heights)
+        base_pillar_count = sum(base_pillars)
+
+        for rotation, piece_rotation in self.candidate_rotations():
+            piece = piece_rotation.array
+            cells = piece_rotation.cells
+            column_bottoms = piece_rotation.column_bottoms
+
+            for col in piece_rotation.columns(board_width).tolist():
+                first_blocked = min(tops[col + j] - bottom for j, bottom in column_bottoms)
+                row = first_blocked - 1
+                if first_blocked < 0:
+                    # Blocked at row 0, but it may slip lower through an overhang
+                    row = self.env.drop_row(piece_rotation, col)
+
+                new_full_rows, hole_delta, changed_heights = profile.placement_features(
+                    [(row + i, col + j) for i, j in cells], is_filled)
+                lines_cleared = base_lines + new_full_rows
+                holes = base_holes + hole_delta
+
+                # Only the pillar flags next to changed columns can change
+                empty_pillars = base_pillar_count
+                if changed_heights:
+                    # Read heights through changed_heights rather than copying all columns
+                    for c in range(max(min(changed_heights) - 1, 0), min(max(changed_heights) + 2, board_width)):
+                        height = changed_heights.get(c, heights[c])
+                        is_pillar = ((c > 0 and changed_heights.get(c - 1, heights[c - 1]) - height >= 3)
+                                     or (c < board_width - 1
+                                         and changed_heights.get(c + 1, heights[c + 1]) - height >= 3))
+                        empty_pillars += is_pillar - base_pillars[c]
+
+                score = self.compute_reward(lines_cleared, holes, row, empty_pillars)
+                if self.is_debug:
+                    self.env.render(given_piece=piece, given_position=[row, col])
+                if score > best_score:
+                    best_score = score
+                    best_position = [row, col]
+                    best_rotation = rotation
+
+        return best_position, best_rotation
+
     def is_valid_position(self, piece, position):
         """Check if the piece can be placed in the given position on the board."""
         for row, line in enumerate(piece):
@@ -166,4 +423,10 @@ class TetrisAgent:
             if render:
                 self.env.render()
 
-        return done
\ No newline at end of file
+        return done
+
+    def place_best_move(self):
+        """Choose the best move and apply it with one env.place transition (headless runs)."""
+        best_position, best_rotation = self.choose_best_move()
+        lines_cleared, done = self.env.place(best_rotation, best_position[1])
+        return done
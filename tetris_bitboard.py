@@ -0,0 +1,138 @@
+from collections import namedtuple
+import numpy as np
+
+# Row masks of one rotated piece plus the leftmost/rightmost occupied column,
+# so horizontal bounds can be checked without looking at the rows.
+PieceMasks = namedtuple('PieceMasks', ['rows', 'left', 'right'])
+
+
+def shift_mask(mask, col):
+    """Shift a piece row mask to start at board column col (col may be -1)."""
+    return mask << col if col >= 0 else mask >> -col
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+def piece_to_masks(piece):
+    """Convert a 2D piece array into its PieceMasks (bit c set = cell in column c)."""
+    rows = tuple(sum(1 << col for col, cell in enumerate(line) if cell) for line in piece)
+    combined = 0
+    for mask in rows:
+        combined |= mask
+    return PieceMasks(rows, (combined & -combined).bit_length() - 1, combined.bit_length() - 1)
+
+
+class BitBoard:
+    """Tetris board stored as one integer bitmask per row.
+
+    Bit c of rows[r] is set when cell (r, c) is filled. Collision tests, piece
+    locking and full-line detection become a few integer AND/OR ops per piece
+    row instead of a walk over every cell."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        self.rows = [0] * height
+
+    @classmethod
+    def from_array(cls, board):
+        """Build a BitBoard from a (height, width) array of 0/1 cells."""
+        height, width = board.shape
+        bitboard = cls(width, height)
+        # Each row packs little-endian into bytes, so bit c of the row's int is cell c
+        packed = np.packbits(np.asarray(board) != 0, axis=1, bitorder='little')
+        row_bytes = packed.shape[1]
+        data = packed.tobytes()
+        bitboard.rows = [int.from_bytes(data[start:start + row_bytes], 'little')
+                         for start in range(0, len(data), row_bytes)]
+        return bitboard
+
+    def to_array(self):
+        """Return the board as a (height, width) int array like TetrisGame.board."""
+        row_bytes = (self.width + 7) // 8
+        data = b''.join(line.to_bytes(row_bytes, 'little') for line in self.rows)
+        packed = np.frombuffer(data, dtype=np.uint8).reshape(self.height, row_bytes)
+        return np.unpackbits(packed, axis=1, count=self.width, bitorder='little').astype(int)
+
+    def copy(self):
+        bitboard = BitBoard.__new__(BitBoard)
+        bitboard.width = self.width
+        bitboard.height = self.height
+        bitboard.full_row = self.full_row
+        bitboard.rows = self.rows.copy()
+        return bitboard
+
+    def clear(self):
+        self.rows = [0] * self.height
+
+    def collides(self, piece, row, col):
+        """Return True if the piece at (row, col) is out of bounds or overlaps a block.
+
+        Rows above the board (row < 0) are allowed, as in TetrisGame.is_valid_position."""
+        if col + piece.left < 0 or col + piece.right >= self.width:
+            return True
+        rows = self.rows
+        for i, mask in enumerate(piece.rows):
+            if mask:
+                x = row + i
+                if x >= self.height:
+                    return True
+                if x >= 0 and rows[x] & shift_mask(mask, col):
+                    return True
+        return False
+
+    def drop_row(self, piece, col):
+        """Return the last valid row when dropping the piece from the top in this column.
+
+        Mirrors the agent's step-by-step drop, so a placement that is invalid
+        from the start returns -1."""
+        row = 0
+        while not self.collides(piece, row, col):
+            row += 1
+        return row - 1
+
+    def lock(self, piece, row, col):
+        """Write the piece into the board, dropping cells that fall outside it."""
+        rows = self.rows
+        for i, mask in enumerate(piece.rows):
+            x = row + i
+            if 0 <= x < self.height:
+                rows[x] |= shift_mask(mask, col) & self.full_row
+
+    def count_full_lines(self):
+        return self.rows.count(self.full_row)
+
+    def clear_lines(self):
+        """Remove full rows, shift the rows above down and return the number removed."""
+        kept = [line for line in self.rows if line != self.full_row]
+        cleared = self.height - len(kept)
+        if cleared:
+            self.rows = [0] * cleared + kept
+        return cleared
+
+    def count_holes(self):
+        """Count empty cells with a filled cell somewhere above them in the same column."""
+        holes = 0
+        covered = 0
+        for line in self.rows:
+            holes += popcount(covered & ~line)
+            covered |= line
+        return holes
+
+    def column_heights(self):
+        """Return the height of every column (0 for an empty column)."""
+        heights = [0] * self.width
+        covered = 0
+        for row, line in enumerate(self.rows):
+            new = line & ~covered
+            while new:
+                lowest = new & -new
+                heights[lowest.bit_length() - 1] = self.height - row
+                new ^= lowest
+            covered |= line
+            if covered == self.full_row:
+                break
+        return heights
@@ -0,0 +1,420 @@
+import random
+import numpy as np
+import time
+from tetris_bitboard import BitBoard
+from tetris_pieces import PIECES, PIECE_COLORS, ROTATIONS
+from board_profile import BoardProfile
+import batch_evaluator
+from tetris_renderer import CANDIDATE, PIECE_INDEX, Frame, make_renderer, paint_piece
+
+class PieceRandomizer:
+    """Seedable piece sequence.
+
+    'uniform' picks each piece independently, 'bag' deals shuffled bags
+    containing every piece once."""
+
+    def __init__(self, piece_names, mode='uniform'):
+        if mode not in ('uniform', 'bag'):
+            raise ValueError(f"Unknown randomizer: {mode!r} (expected 'uniform' or 'bag')")
+        self.piece_names = piece_names
+        self.mode = mode
+        self.rng = random.Random()
+        self.bag = []
+
+    def reset(self, seed=None):
+        """Start a new sequence, reseeding it when a seed is given."""
+        if seed is not None:
+            self.rng.seed(seed)
+        self.bag = []
+
+    def draw(self):
+        if self.mode == 'uniform':
+            return self.rng.choice(self.piece_names)
+        if not self.bag:
+            self.bag = list(self.piece_names)
+            self.rng.shuffle(self.bag)
+        return self.bag.pop()
+
+class TetrisGame:
+    """The Tetris simulator, without gym.
+
+    Headless code (the agent, training, benchmarks) uses this directly, so
+    importing it loads neither gym nor pygame. tetris_env.TetrisEnv adds the
+    gym interface on top."""
+
+    def __init__(self, board_width=10, board_height=20, time_delay=0.0, backend='numpy', randomizer='uniform',
+                 renderer='pygame', recorder=None, max_pieces=None, max_lines=None, time_limit=None):
+
+        # Piece sequence, seeded through reset(seed=...)
+        self.randomizer = randomizer
+        self.piece_randomizer = PieceRandomizer(list(PIECES), randomizer)
+
+        if backend not in ('numpy', 'bitboard'):
+            raise ValueError(f"Unknown board backend: {backend!r} (expected 'numpy' or 'bitboard')")
+        self.backend = backend
+        self.bitboard = BitBoard(board_width, board_height) if backend == 'bitboard' else None
+        self._board_cache = None
+
+        self.new_piece_spawned = False
+
+        self.time_delay = time_delay
+
+        self.lines_cleared_count = 0
+        self.pieces_placed = 0
+        
+        self.board_width = board_width
+        self.board_height = board_height
+        self.board = np.zeros((board_height, board_width), dtype=int)
+        
+        # Defining the pieces
+        self.pieces = PIECES
+        # Precomputed rotations of every piece (arrays, cells and bitboard masks)
+        self.rotations = ROTATIONS
+
+        self.pieces_colors = PIECE_COLORS
+        
+        self.current_piece = None
+        self.current_piece_name = None
+        # Preview of the piece that spawns after the current one
+        self.next_piece_name = None
+        self.current_rotation = 0
+        self.current_position = None
+        self.current_piece_color = (0, 0, 0)
+        if isinstance(renderer, str) and renderer not in ('pygame', 'none'):
+            raise ValueError(f"Unknown renderer: {renderer!r} (expected 'pygame' or 'none')")
+        # Renderer name ('pygame' or 'none') or a renderer object; a named one is created on the first render()
+        self.renderer_kind = renderer if isinstance(renderer, str) else 'none'
+        self.renderer = None if isinstance(renderer, str) else renderer
+        self.cell_size = 30
+
+        # Optional replay.ReplayWriter that records every game played on this env
+        self.recorder = recorder
+
+        # Optional caps that end a game early (time_limit in seconds of wall-clock
+        # time). A game ended by a cap is done with truncated set to the cap's name.
+        self.max_pieces = max_pieces
+        self.max_lines = max_lines
+        self.time_limit = time_limit
+        self.truncated = None
+        self.start_time = None
+
+        self.reset()
+
+    @property
+    def board(self):
+        """The board as a (height, width) array; materialized on demand for the bitboard backend."""
+        if self.bitboard is None:
+            return self._board
+        if self._board_cache is None:
+            self._board_cache = self.bitboard.to_array()
+        return self._board_cache
+
+    @board.setter
+    def board(self, value):
+        if self.bitboard is None:
+            self._board = value
+        else:
+            self.bitboard = BitBoard.from_array(np.asarray(value))
+            self._board_cache = None
+        self.profile = BoardProfile.from_array(np.asarray(value))
+
+    def board_column(self, col):
+        """Return the cells of one column, top to bottom."""
+        if self.bitboard is None:
+            return self._board[:, col].tolist()
+        return [(line >> col) & 1 for line in self.bitboard.rows]
+
+    def drop_row(self, piece, col):
+        """Row a PieceRotation comes to rest at when dropped from the top in this column, as the agent drops it."""
+        if self.bitboard is None:
+            return batch_evaluator.drop_row(self._board, piece, col)
+        return self.bitboard.drop_row(piece.masks, col)
+
+    def is_filled(self, x, y):
+        if self.bitboard is None:
+            return self._board[x, y] != 0
+        return (self.bitboard.rows[x] >> y) & 1 == 1
+
+    def reset(self, seed=None):
+        """Start a new game. Passing a seed makes the piece sequence reproducible."""
+        self.piece_randomizer.reset(seed)
+        self.next_piece_name = None
+        self.lines_cleared_count = 0
+        self.pieces_placed = 0
+        self.truncated = None
+        self.start_time = time.perf_counter()
+        if self.bitboard is None:
+            self.board.fill(0)
+        else:
+            self.bitboard.clear()
+            self._board_cache = None
+        self.profile = BoardProfile(self.board_width, self.board_height)
+        if self.recorder is not None:
+            self.recorder.begin_game(seed, self.board_width, self.board_height)
+        self.spawn_piece()
+        return self.get_state()
+    
+    
+    def get_piece_in_stable_grid(self):
+        """Return a stable 4x4 grid containing the current piece centered."""
+        # Initialize a 4x4 grid of zeros
+        stable_grid = np.zeros((4, 4), dtype=int)
+        
+        # Get dimensions of the current piece
+        piece_height, piece_width = self.current_piece.shape
+        
+        # Calculate the starting position to center the piece in the 4x4 grid
+        start_row = (4 - piece_height) // 2
+        start_col = (4 - piece_width) // 2
+        
+        # Place the piece in the center of the 4x4 grid
+        stable_grid[start_row:start_row + piece_height, start_col:start_col + piece_width] = self.current_piece
+        
+        return stable_grid
+        
+    def step(self, action):
+        done = False
+
+        # Handle horizontal movement and rotation first
+        if action == 0:
+            self.move_left()
+        elif action == 1:
+            self.move_right()
+        elif action == 2:
+            self.rotate()
+
+        # Always drop the piece by one space each step
+        self.current_position[0] += 1
+
+        # Check if the piece has landed
+        if not self.is_valid_position():
+            # Move piece back up
+            self.current_position[0] -= 1
+            # Lock the piece in place (current board + our current piece)
+            self.lock_piece()
+            # Clear any full lines
+            lines_cleared = self.clear_lines()
+            self.record_move(lines_cleared)
+            # Spawn new piece
+            self.spawn_piece()
+            # Check if game is over
+            if not self.is_valid_position():
+                done = True
+                self.record_game_over()
+            else:
+                done = self.check_caps()
+
+        return self.get_state(), done
+
+    def place(self, rotation, col):
+        """Place the current piece in a single transition and spawn the next one.
+
+        The piece is rotated `rotation` times and shifted towards `col` one
+        move at a time, each move only applied if the piece fits (like the
+        step actions, but without falling a row in between). It is then hard
+        dropped, locked and full lines are cleared. Returns (lines_cleared, done)."""
+        for _ in range(rotation):
+            self.rotate()
+        while self.current_position[1] != col:
+            previous_col = self.current_position[1]
+            if self.current_position[1] > col:
+                self.move_left()
+            else:
+                self.move_right()
+            if self.current_position[1] == previous_col:
+                break
+
+        # Hard drop. When the piece is above the stack in all its columns, the
+        # column heights give the landing row directly; otherwise (e.g. under
+        # an overhang) it falls one row at a time.
+        row, col = self.current_position
+        first_blocked = min(self.board_height - self.profile.heights[col + j] - bottom
+                            for j, bottom in self.current_piece_rotation().column_bottoms)
+        if row < first_blocked:
+            self.current_position[0] = first_blocked - 1
+        else:
+            while self.is_valid_position():
+                self.current_position[0] += 1
+            self.current_position[0] -= 1
+
+        self.lock_piece()
+        lines_cleared = self.clear_lines()
+        self.record_move(lines_cleared)
+        self.spawn_piece()
+        done = not self.is_valid_position()
+        if done:
+            self.record_game_over()
+        else:
+            done = self.check_caps()
+        return lines_cleared, done
+
+    def check_caps(self):
+        """End the game if it reached max_pieces, max_lines or time_limit. Returns whether it did."""
+        if self.max_pieces is not None and self.pieces_placed >= self.max_pieces:
+            self.truncated = 'pieces'
+        elif self.max_lines is not None and self.lines_cleared_count >= self.max_lines:
+            self.truncated = 'lines'
+        elif self.time_limit is not None and time.perf_counter() - self.start_time >= self.time_limit:
+            self.truncated = 'time'
+        else:
+            return False
+        self.record_game_over()
+        return True
+
+    def record_move(self, lines_cleared):
+        """Pass the piece just locked to the recorder, if any."""
+        if self.recorder is not None:
+            self.recorder.record_move(self.current_piece_name, self.current_rotation, *self.current_position,
+                                      lines_cleared)
+
+    def record_game_over(self):
+        if self.recorder is not None:
+            self.recorder.end_game()
+
+    def current_piece_masks(self):
+        """Return the bitboard masks of the current piece in its current rotation."""
+        return self.current_piece_rotation().masks
+
+    def current_piece_rotation(self):
+        """Return the precomputed PieceRotation of the current piece."""
+        return self.rotations[self.current_piece_name][self.current_rotation]
+
+    def lock_piece(self):
+        """Write the current piece into the board at its current position."""
+        self.pieces_placed += 1
+        cells = []
+        for row, col in self.current_piece_rotation().cells:
+            x, y = self.current_position[0] + row, self.current_position[1] + col
+            if 0 <= x < self.board_height and 0 <= y < self.board_width and not self.is_filled(x, y):
+                cells.append((x, y))
+        self.profile.add_cells(cells)
+
+        if self.bitboard is not None:
+            self.bitboard.lock(self.current_piece_masks(), *self.current_position)
+            self._board_cache = None
+            return
+        state = np.copy(self.board)
+        for x, y in cells:
+            state[x, y] = 1
+        self._board = state
+    
+    def clear_lines(self):
+        """Clear full lines and make pieces above fall down.
+        Returns the number of lines cleared."""
+        full_rows = self.profile.full_rows()
+        if not full_rows:
+            return 0
+        self.profile.clear_rows(full_rows, self.board_column)
+
+        if self.bitboard is not None:
+            lines_cleared = self.bitboard.clear_lines()
+            if lines_cleared:
+                self.lines_cleared_count += lines_cleared
+                self._board_cache = None
+            return lines_cleared
+
+        lines_cleared = 0
+        # Check each line from bottom to top
+        y = self.board_height - 1
+        while y >= 0:
+            # If line is full (no zeros)
+            if np.all(self.board[y]):
+                self.lines_cleared_count += 1
+                lines_cleared += 1
+                # Move all lines above down
+                self.board[1:y + 1] = self.board[0:y]
+                # Clear top line
+                self.board[0].fill(0)
+            else:
+                y -= 1
+        
+        return lines_cleared
+    
+    def count_holes(self):
+        """Count the number of holes (empty cells with filled cells above them)"""
+        return sum(self.profile.holes)
+    
+    def spawn_piece(self):
+        # Randomly select a piece
+        self.new_piece_spawned = True
+        piece_name = self.next_piece_name or self.draw_piece_name()
+        self.next_piece_name = self.draw_piece_name()
+        self.set_current_piece(piece_name)
+
+    def set_current_piece(self, piece_name):
+        """Make piece_name the current piece, unrotated at the spawn position."""
+        self.current_piece_name = piece_name
+        self.current_piece_color = self.pieces_colors[piece_name]
+        self.current_rotation = 0
+        self.current_piece = self.rotations[piece_name][0].array
+        self.current_position = [0, self.board_width // 2 - len(self.current_piece[0]) // 2]
+
+    def load_position(self, board, piece_name):
+        """Replace the board and current piece, e.g. to evaluate a given position."""
+        self.board = np.array(board, dtype=int)
+        self.set_current_piece(piece_name)
+
+    def draw_piece_name(self):
+        """Draw the next piece from the env's randomizer."""
+        return self.piece_randomizer.draw()
+
+    def get_state(self):
+        """Return the current board state and the current piece in a stable 4x4 grid."""
+        return {
+            'board': np.copy(self.board),
+            'current_piece': self.get_piece_in_stable_grid(),
+            'current_position' : self.current_position
+        }
+        
+    def render(self, mode='human', given_piece=None, given_position=None):
+        """Send a snapshot of the board, the current piece and optionally a given piece to the renderer.
+
+        Drawing happens in the renderer's own process, so this returns right
+        away; only time_delay, if set, paces the game for watching."""
+        if self.renderer is None:
+            self.renderer = make_renderer(self.renderer_kind, self.board_width, self.board_height, self.cell_size)
+        self.renderer.submit(self.snapshot(given_piece, given_position))
+
+        if self.time_delay != 0:
+            time.sleep(self.time_delay)
+
+    def snapshot(self, given_piece=None, given_position=None):
+        """Return the board with the current piece (and the given piece on top) as a Frame."""
+        colors = (self.board != 0).astype(np.int8)
+        paint_piece(colors, self.current_piece, self.current_position, PIECE_INDEX[self.current_piece_name])
+        if given_piece is not None and given_position is not None:
+            paint_piece(colors, given_piece, given_position, CANDIDATE)
+        return Frame(colors, self.lines_cleared_count)
+
+    def close(self):
+        """Close the renderer, if one was created."""
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
+
+    def move_left(self):
+        self.current_position[1] -= 1
+        if not self.is_valid_position():
+            self.current_position[1] += 1
+    
+    def move_right(self):
+        self.current_position[1] += 1
+        if not self.is_valid_position():
+            self.current_position[1] -= 1
+    
+    def rotate(self):
+        self.current_rotation = (self.current_rotation + 1) % 4
+        self.current_piece = self.current_piece_rotation().array
+        if not self.is_valid_position():
+            self.current_rotation = (self.current_rotation - 1) % 4
+            self.current_piece = self.current_piece_rotation().array
+
+    def is_valid_position(self):
+        if self.bitboard is not None:
+            return not self.bitboard.collides(self.current_piece_masks(), *self.current_position)
+        board = self.board
+        for row, col in self.current_piece_rotation().cells:
+            x, y = self.current_position[0] + row, self.current_position[1] + col
+            if x >= self.board_height or y < 0 or y >= self.board_width or (x >= 0 and board[x, y]):
+                return False
+        return True
\ No newline at end of file
@@ -0,0 +1,211 @@
+from collections import namedtuple
+from functools import cached_property, lru_cache
+import numpy as np
+
+# A board feature: compute(stats) returns one value per board of a BoardStats,
+# weight is its default weight in the agent's linear evaluator.
+Feature = namedtuple('Feature', ['name', 'compute', 'weight', 'description'])
+
+FEATURES = {}
+
+
+def feature(name, weight):
+    """Decorator registering compute(stats) as the feature name with a default weight."""
+    def register(compute):
+        FEATURES[name] = Feature(name, compute, weight, (compute.__doc__ or '').strip())
+        return compute
+    return register
+
+
+class BoardStats:
+    """Intermediates shared by the features of a stack of candidate boards.
+
+    boards is an (N, rows, width) stack with the piece written in and full
+    lines not cleared yet; rows holds the row each piece landed at. The
+    stack may leave out empty top rows of boards board_height tall (see
+    batch_evaluator.build_candidates(crop=True)); features are computed as
+    for the full boards. Every intermediate is computed on first use and
+    then reused by all features, so selecting more features adds little
+    besides the features themselves."""
+
+    def __init__(self, boards, rows, board_height=None):
+        self.boards = boards
+        self.rows = np.asarray(rows)
+        self.count, stack_height, self.width = boards.shape
+        self.height = stack_height if board_height is None else board_height
+        # Empty rows left out above the stack
+        self.empty_rows = self.height - stack_height
+
+    @cached_property
+    def filled(self):
+        return self.boards != 0
+
+    @cached_property
+    def covered(self):
+        """Cells at or below the topmost filled cell of their column."""
+        return np.logical_or.accumulate(self.filled, axis=1)
+
+    @cached_property
+    def hole_cells(self):
+        return self.covered & ~self.filled
+
+    @cached_property
+    def column_heights(self):
+        """(N, width) heights of the columns, 0 for an empty column."""
+        return self.covered.sum(axis=1)
+
+    @cached_property
+    def lines_cleared(self):
+        return self.filled.all(axis=2).sum(axis=1)
+
+    @cached_property
+    def holes(self):
+        return self.hole_cells.sum(axis=(1, 2))
+
+
+@lru_cache(maxsize=None)
+def squared_lines_table(board_height):
+    # Built with the same scalar expressions as TetrisAgent.compute_reward, so scores match it bit for bit
+    return np.array([min(lines / 4, 1) ** 2 for lines in range(board_height + 1)])
+
+
+@lru_cache(maxsize=None)
+def squared_heights_table(board_height):
+    return np.array([(height / board_height) ** 2 for height in range(-1, board_height)])
+
+
+# The four original features keep the signs TetrisAgent.compute_reward gives
+# them, so existing weight vectors score exactly as before. Their default
+# weights are the agent's trained ones.
+
+@feature('lines', 0.42657453)
+def lines(stats):
+    """Full lines, normalized to [0, 1] by 4 and squared."""
+    return squared_lines_table(stats.height)[stats.lines_cleared]
+
+
+@feature('holes', 1.17615849)
+def holes(stats):
+    """Minus the empty cells below a filled cell, normalized by the board area."""
+    return -np.minimum(stats.holes / (stats.width * stats.height), 1)
+
+
+@feature('height', -0.0422209)
+def height(stats):
+    """Minus the squared landing row over the board height (the row grows towards the floor)."""
+    return -squared_heights_table(stats.height)[stats.rows + 1]
+
+
+@feature('empty_pillars', -0.82640537)
+def empty_pillars(stats):
+    """Columns with a neighbour at least 3 rows higher, counted from 2 up and normalized by 5 per 10 columns."""
+    heights = stats.column_heights
+    pillars = np.zeros(heights.shape, dtype=bool)
+    pillars[:, 1:] |= heights[:, :-1] - heights[:, 1:] >= 3
+    pillars[:, :-1] |= heights[:, 1:] - heights[:, :-1] >= 3
+    count = pillars.sum(axis=1)
+    scale = stats.width / 10
+    return np.where(count >= 2 * scale, np.minimum(count / (5 * scale), 1), 0)
+
+
+# Further features are plain non-negative measures, so they mostly get negative weights
+
+@feature('aggregate_height', -0.5)
+def aggregate_height(stats):
+    """Sum of the column heights, normalized by the board area."""
+    return stats.column_heights.sum(axis=1) / (stats.width * stats.height)
+
+
+@feature('max_height', -0.1)
+def max_height(stats):
+    """Height of the tallest column over the board height."""
+    return stats.column_heights.max(axis=1) / stats.height
+
+
+@feature('bumpiness', -0.2)
+def bumpiness(stats):
+    """Sum of the height differences of adjacent columns."""
+    differences = np.abs(np.diff(stats.column_heights, axis=1)).sum(axis=1)
+    return differences / (stats.height * max(stats.width - 1, 1))
+
+
+@feature('row_transitions', -0.3)
+def row_transitions(stats):
+    """Filled/empty changes along each row, the side walls counting as filled."""
+    filled = stats.filled
+    # An empty row changes twice, at its walls
+    transitions = ((filled[:, :, 1:] != filled[:, :, :-1]).sum(axis=(1, 2))
+                   + (~filled[:, :, 0]).sum(axis=1) + (~filled[:, :, -1]).sum(axis=1) + 2 * stats.empty_rows)
+    return transitions / (stats.height * (stats.width + 1))
+
+
+@feature('column_transitions', -0.3)
+def column_transitions(stats):
+    """Filled/empty changes down each column, the floor counting as filled."""
+    filled = stats.filled
+    transitions = ((filled[:, 1:, :] != filled[:, :-1, :]).sum(axis=(1, 2))
+                   + filled[:, 0, :].sum(axis=1) + (~filled[:, -1, :]).sum(axis=1))
+    return transitions / (stats.width * (stats.height + 1))
+
+
+@feature('wells', -0.3)
+def wells(stats):
+    """Depth of every column below both its neighbours, the side walls being full height."""
+    walls = np.full((stats.count, 1), stats.height)
+    heights = np.concatenate([walls, stats.column_heights, walls], axis=1)
+    depths = np.minimum(heights[:, :-2], heights[:, 2:]) - heights[:, 1:-1]
+    return np.maximum(depths, 0).sum(axis=1) / (stats.width * stats.height)
+
+
+@feature('row_holes', -0.5)
+def row_holes(stats):
+    """Rows containing at least one hole, over the board height."""
+    return stats.hole_cells.any(axis=2).sum(axis=1) / stats.height
+
+
+# The agent's original evaluator
+DEFAULT_FEATURES = ('lines', 'holes', 'height', 'empty_pillars')
+
+
+def default_weights(features=DEFAULT_FEATURES):
+    """The registered default weights of the given features, in order."""
+    return [FEATURES[name].weight for name in features]
+
+
+class LinearEvaluator:
+    """Scores candidate boards as the weighted sum of a selection of registered features.
+
+    The feature functions are looked up once, when the evaluator is built;
+    score() then evaluates them all over one BoardStats of the whole
+    candidate stack, so they share its intermediates."""
+
+    def __init__(self, features=DEFAULT_FEATURES):
+        features = tuple(features)
+        unknown = [name for name in features if name not in FEATURES]
+        if unknown or not features:
+            raise ValueError(f"Unknown features: {', '.join(unknown) or '(none selected)'} "
+                             f"(expected some of {', '.join(FEATURES)})")
+        self.features = features
+        self.computes = [FEATURES[name].compute for name in features]
+
+    def __len__(self):
+        return len(self.features)
+
+    def values(self, boards, rows, board_height=None):
+        """(N, len(features)) matrix of the feature values of every board."""
+        stats = BoardStats(boards, rows, board_height)
+        return np.stack([compute(stats) for compute in self.computes], axis=1).astype(float)
+
+    def score(self, boards, rows, weights, board_height=None):
+        """Weighted sum of the features of every board in an (N, height, width) stack.
+
+        board_height is the height of the boards when empty top rows were cropped off the stack."""
+        if len(weights) != len(self.computes):
+            raise ValueError(f"Got {len(weights)} weights for {len(self.computes)} features "
+                             f"({', '.join(self.features)})")
+        stats = BoardStats(boards, rows, board_height)
+        # Summed term by term, in order, so the default features add up exactly like compute_reward
+        scores = self.computes[0](stats) * weights[0]
+        for compute, weight in zip(self.computes[1:], weights[1:]):
+            scores = scores + compute(stats) * weight
+        return scores
@@ -0,0 +1,85 @@
+import numpy as np
+from tetris_bitboard import piece_to_masks
+
+PIECES = {
+    'I': [[1, 1, 1, 1]],
+    'J': [[1, 0, 0], [1, 1, 1]],
+    'L': [[0, 0, 1], [1, 1, 1]],
+    'O': [[1, 1], [1, 1]],
+    'S': [[0, 1, 1], [1, 1, 0]],
+    'T': [[0, 1, 0], [1, 1, 1]],
+    'Z': [[1, 1, 0], [0, 1, 1]]
+}
+
+PIECE_COLORS = {
+    'I': (110, 236, 238),
+    'J': (0, 0, 230),
+    'L': (228, 164, 57),
+    'O': (240, 240, 79),
+    'S': (110, 236, 71),
+    'T': (146, 28, 231),
+    'Z': (220, 47, 33)
+}
+
+
+class PieceRotation:
+    """One rotation of a piece with the geometry the env and agent need, computed once.
+
+    rotation is the number of clockwise rotate presses from the spawn
+    orientation, i.e. array is np.rot90(piece, -rotation). The array is
+    read-only because the same instance is shared by every env and agent."""
+
+    def __init__(self, name, rotation, array):
+        self.name = name
+        self.rotation = rotation
+        self.array = np.ascontiguousarray(array)
+        self.array.flags.writeable = False
+        self.height, self.width = self.array.shape
+
+        # Filled cells as (row, col) offsets from the piece's top-left corner
+        self.cells_x, self.cells_y = np.nonzero(self.array)
+        self.cells = tuple(zip(self.cells_x.tolist(), self.cells_y.tolist()))
+
+        # Occupied columns and the lowest filled row in each, used to find landing rows
+        self.offsets = np.nonzero(self.array.any(axis=0))[0]
+        self.bottoms = self.height - 1 - np.argmax(self.array[::-1, self.offsets] != 0, axis=0)
+        self.column_bottoms = tuple(zip(self.offsets.tolist(), self.bottoms.tolist()))
+        self.left = int(self.offsets[0])
+        self.right = int(self.offsets[-1])
+
+        self.masks = piece_to_masks(self.array)
+        self._columns = {}
+
+    def columns(self, board_width):
+        """Left-edge columns, from -1 up, where the piece lies fully inside a board of this width."""
+        columns = self._columns.get(board_width)
+        if columns is None:
+            columns = np.arange(max(-1, -self.left), board_width - self.right)
+            columns.flags.writeable = False
+            self._columns[board_width] = columns
+        return columns
+
+
+def distinct_rotations(rotations, start):
+    """Return (presses, PieceRotation) for every distinct shape reachable from rotation start.
+
+    Rotations that repeat an earlier shape (O has one distinct shape, I, S and
+    Z have two) are left out; the first, fewest-presses one is kept."""
+    seen = set()
+    distinct = []
+    for presses in range(4):
+        rotation = rotations[(start + presses) % 4]
+        key = (rotation.array.shape, rotation.array.tobytes())
+        if key not in seen:
+            seen.add(key)
+            distinct.append((presses, rotation))
+    return distinct
+
+
+# ROTATIONS[name][r]: the piece after r rotate presses from its spawn orientation
+ROTATIONS = {name: [PieceRotation(name, rotation, np.rot90(np.array(shape), -rotation)) for rotation in range(4)]
+             for name, shape in PIECES.items()}
+
+# CANDIDATE_ROTATIONS[name][r]: the rotations the agent searches for a piece currently in rotation r
+CANDIDATE_ROTATIONS = {name: [distinct_rotations(rotations, start) for start in range(4)]
+                       for name, rotations in ROTATIONS.items()}
@@ -0,0 +1,171 @@
+import multiprocessing
+from collections import namedtuple
+import numpy as np
+from tetris_pieces import PIECES, PIECE_COLORS
+
+# A snapshot of what to draw: colors is a (height, width) array of PALETTE indices
+Frame = namedtuple('Frame', ['colors', 'lines_cleared'])
+
+EMPTY, LOCKED, CANDIDATE = 0, 1, 2
+PALETTE = [(10, 10, 10), (250, 0, 0), (0, 0, 100)] + [PIECE_COLORS[name] for name in PIECES]
+PIECE_INDEX = {name: 3 + index for index, name in enumerate(PIECES)}
+BACKGROUND = (50, 50, 50)
+
+
+def paint_piece(colors, piece, position, color):
+    """Set the cells of a piece array at position to color, skipping cells outside the board."""
+    height, width = colors.shape
+    for row, line in enumerate(piece):
+        for col, cell in enumerate(line):
+            if cell:
+                x, y = position[0] + row, position[1] + col
+                if 0 <= x < height and 0 <= y < width:
+                    colors[x, y] = color
+
+
+def make_renderer(kind, board_width, board_height, cell_size=30, fps=60):
+    """Create a renderer by name: 'pygame' (a window) or 'none' (draws nothing)."""
+    if kind == 'pygame':
+        return PygameRenderer(board_width, board_height, cell_size, fps)
+    if kind == 'none':
+        return NullRenderer()
+    raise ValueError(f"Unknown renderer: {kind!r} (expected 'pygame' or 'none')")
+
+
+class NullRenderer:
+    """Renderer that accepts frames and draws nothing, for headless runs."""
+
+    def __init__(self):
+        self.frames_submitted = 0
+        self.frames_drawn = 0
+
+    def submit(self, frame):
+        self.frames_submitted += 1
+
+    def close(self):
+        pass
+
+
+class PygameRenderer:
+    """Draws frames in a pygame window run by a separate process.
+
+    pygame (SDL) needs its window and events on a process's main thread,
+    which macOS enforces, so the window lives on the main thread of a child
+    process. submit() copies the frame into a shared-memory slot and returns,
+    so the game loop never waits for drawing. The child draws the latest
+    frame at most fps times per second; frames submitted in between are
+    dropped. Only the cells that changed since the last drawn frame are
+    redrawn, and the font and score text surfaces are cached. The game
+    process never imports pygame."""
+
+    def __init__(self, board_width, board_height, cell_size=30, fps=60, caption="Tetris Environment"):
+        self.board_width = board_width
+        self.board_height = board_height
+        self.cell_size = cell_size
+        self.fps = fps
+        self.caption = caption
+        self.frames_submitted = 0
+
+        # The frame slot: colors, score and a sequence number bumped by every submit, guarded by _lock
+        self._colors = multiprocessing.RawArray('b', board_width * board_height)
+        self._colors_view = np.frombuffer(self._colors, dtype=np.int8).reshape(board_height, board_width)
+        self._lines_cleared = multiprocessing.RawValue('q', 0)
+        self._sequence = multiprocessing.RawValue('q', 0)
+        self._frames_drawn = multiprocessing.RawValue('q', 0)
+        self._lock = multiprocessing.Lock()
+        self._submitted = multiprocessing.Event()
+        self._closed = multiprocessing.Event()
+        self._process = multiprocessing.Process(
+            target=_draw_frames, name='tetris-renderer', daemon=True,
+            args=(self._colors, self._lines_cleared, self._sequence, self._frames_drawn, self._lock,
+                  self._submitted, self._closed, board_width, board_height, cell_size, fps, caption))
+        self._process.start()
+
+    @property
+    def frames_drawn(self):
+        return self._frames_drawn.value
+
+    def submit(self, frame):
+        """Hand a Frame to the drawing process, replacing any frame not drawn yet."""
+        with self._lock:
+            self._colors_view[...] = frame.colors
+            self._lines_cleared.value = frame.lines_cleared
+            self._sequence.value += 1
+        self.frames_submitted += 1
+        self._submitted.set()
+
+    def close(self):
+        """Stop the drawing process and close the window."""
+        self._closed.set()
+        self._submitted.set()
+        self._process.join()
+
+
+def _draw_frames(colors, lines_cleared, sequence, frames_drawn, lock, submitted, closed, board_width, board_height,
+                 cell_size, fps, caption):
+    """Main loop of PygameRenderer's drawing process."""
+    import pygame
+
+    pygame.init()
+    size = cell_size
+    screen = pygame.display.set_mode((board_width * size, board_height * size))
+    pygame.display.set_caption(caption)
+    screen.fill(BACKGROUND)
+    pygame.display.flip()
+    font = pygame.font.Font(None, 36)
+    clock = pygame.time.Clock()
+    shared_colors = np.frombuffer(colors, dtype=np.int8).reshape(board_height, board_width)
+
+    drawn = None
+    drawn_sequence = 0
+    drawn_text = None
+    text_cache = {}
+    text_rect = None
+    text_rows = text_cols = 0
+    while not closed.is_set():
+        # Wake up now and then without new frames too, so the window keeps handling its events
+        submitted.wait(0.1)
+        submitted.clear()
+        if any(event.type == pygame.QUIT for event in pygame.event.get()):
+            break
+        with lock:
+            if sequence.value == drawn_sequence:
+                continue
+            drawn_sequence = sequence.value
+            frame = Frame(shared_colors.copy(), lines_cleared.value)
+
+        text = text_cache.get(frame.lines_cleared)
+        if text is None:
+            text = font.render(f"Lines Cleared: {frame.lines_cleared}", True, (255, 255, 255))
+            text_cache = {frame.lines_cleared: text}
+
+        if drawn is None:
+            changed = np.ones(frame.colors.shape, dtype=bool)
+        else:
+            changed = frame.colors != drawn
+        # The score is drawn over the top-left cells, so redraw them together with it
+        redraw_text = text is not drawn_text or changed[:text_rows, :text_cols].any()
+        if redraw_text:
+            dirty_text = text.get_rect(topleft=(10, 10))
+            if text_rect is not None:
+                dirty_text.union_ip(text_rect)
+            text_rect = text.get_rect(topleft=(10, 10))
+            text_rows = dirty_text.bottom // size + 1
+            text_cols = dirty_text.right // size + 1
+            changed[:text_rows, :text_cols] = True
+
+        dirty = []
+        for row, col in zip(*np.nonzero(changed)):
+            rect = pygame.Rect(col * size, row * size, size - 1, size - 1)
+            pygame.draw.rect(screen, PALETTE[frame.colors[row, col]], rect)
+            dirty.append(rect)
+        if redraw_text:
+            screen.blit(text, text_rect)
+        pygame.display.update(dirty)
+
+        drawn = frame.colors
+        drawn_text = text
+        frames_drawn.value += 1
+        clock.tick(fps)
+
+    pygame.quit()
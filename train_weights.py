@@ -1,93 +1,369 @@
+import argparse
+import os
 import numpy as np
-from tetris_agent import TetrisAgent
-from tetris_env import TetrisEnv
+from game_evaluator import GameEvaluator
+from evaluation_service import EvaluationService, ResultCache
+from training_io import ResultsLog, load_checkpoint, save_checkpoint
+from tetris_features import DEFAULT_FEATURES, FEATURES, default_weights
 import random
 import math
 
+def draw_game_seeds(rng, count):
+    """Draw piece-sequence seeds for a set of games."""
+    return [rng.randrange(2 ** 32) for _ in range(count)]
+
+def log_evaluation(results_log, algorithm, iteration, weights, stats):
+    if results_log is not None:
+        results_log.write(algorithm=algorithm, iteration=iteration, weights=weights, score=stats.mean,
+                          scores=stats.scores, seeds=stats.seeds, variance=stats.variance,
+                          ci=[stats.ci_low, stats.ci_high], pieces=stats.pieces, censored=stats.censored)
+
 # Define the simulated annealing process
 class SimulatedAnnealingOptimizer:
-    def __init__(self, agent, initial_weights, temperature=100.0, cooling_rate=0.9999):
-        self.agent = agent
+    def __init__(self, evaluator: GameEvaluator, initial_weights, temperature=100.0, cooling_rate=0.9999,
+                 games_per_evaluation=5, seed=None, results_log: ResultsLog = None, common_seeds=False,
+                 cache: ResultCache = None, max_games=None, scoring='lines'):
+        self.evaluator = evaluator
+        self.service = EvaluationService(evaluator, cache, scoring=scoring)
         self.weights = initial_weights
+        # Random restarts keep the sign of every initial weight
+        self.signs = np.where(np.asarray(initial_weights) < 0, -1, 1)
         self.temperature = temperature
         self.cooling_rate = cooling_rate
+        self.games_per_evaluation = games_per_evaluation
+        # With max_games above games_per_evaluation, weights keep playing more
+        # games (up to max_games) while they cannot be told apart from the best
+        self.max_games = max(max_games or games_per_evaluation, games_per_evaluation)
+        self.results_log = results_log
+        # Own RNG for game seeds and acceptance
+        self.rng = random.Random(seed)
+        if seed is not None:
+            np.random.seed(seed)
+        # With common seeds every weight vector plays the same games, so score
+        # differences come from the weights rather than the piece sequences
+        self.game_seeds = draw_game_seeds(self.rng, self.max_games) if common_seeds else None
+
+        self.iteration = 0
+        self.best_weights = None
+        self.best_score = None
+        # EvaluationStats of the best weights and of the latest evaluation
+        self.best_stats = None
+        self.last_stats = None
 
     def objective_function(self, weights):
-        # Update the agent's weights
-        self.agent.weights = weights
-
-        # Run a game and calculate the score as the evaluation criteria
-        full_games = 5
-        average_score = 0
-        score = 0
-        for _ in range(full_games):
-            done = False
-            self.agent.env.reset()
-            while not done:
-                if env.new_piece_spawned:
-                    self.agent.execute_best_move()
-                    self.agent.env.new_piece_spawned = False
-                state, done = env.step(-1)
-            score += self.agent.env.lines_cleared_count
-        average_score = score / full_games
-        return average_score
+        # Run games and use the average lines cleared as the evaluation criteria
+        seeds = self.game_seeds or draw_game_seeds(self.rng, self.max_games)
+        if self.max_games > self.games_per_evaluation:
+            stats = self.service.evaluate_adaptive([weights], seeds, self.games_per_evaluation, self.best_stats)[0]
+        else:
+            stats = self.service.evaluate([weights], seeds)[0]
+        self.last_stats = stats
+        log_evaluation(self.results_log, 'annealing', self.iteration, weights, stats)
+        return stats.mean
+
+    def get_state(self):
+        """Return everything needed to resume the run exactly, including RNG states."""
+        return {
+            'algorithm': 'annealing',
+            'iteration': self.iteration,
+            'weights': self.weights,
+            'temperature': self.temperature,
+            'best_weights': self.best_weights,
+            'best_score': self.best_score,
+            'best_stats': self.best_stats,
+            'game_seeds': self.game_seeds,
+            'rng_state': self.rng.getstate(),
+            'np_random_state': np.random.get_state(),
+        }
+
+    def set_state(self, state):
+        self.iteration = state['iteration']
+        self.weights = state['weights']
+        self.temperature = state['temperature']
+        self.best_weights = state['best_weights']
+        self.best_score = state['best_score']
+        self.best_stats = state.get('best_stats')
+        self.game_seeds = state['game_seeds']
+        self.rng.setstate(state['rng_state'])
+        np.random.set_state(state['np_random_state'])
 
     def perturb_weights(self):
         # Slightly adjust each weight randomly to explore the solution space
         noise_scale = 0.1
-        return self.weights + np.random.normal(0, noise_scale, size=4)
+        return self.weights + np.random.normal(0, noise_scale, size=len(self.weights))
 
-    def optimize(self, iterations=1500):
-        best_weights = self.weights
-        best_score = self.objective_function(self.weights)
-        
-        for i in range(iterations):
+    def optimize(self, iterations=1500, checkpoint_path=None, checkpoint_every=10):
+        # A resumed run already has its best score
+        if self.best_score is None:
+            self.best_weights = self.weights
+            self.best_score = self.objective_function(self.weights)
+            self.best_stats = self.last_stats
+
+        for i in range(self.iteration, iterations):
 
             new_weights = self.perturb_weights()
 
-            if i % int((iterations / 50)) == 0 and i != 0:
-                new_weights = 2 * np.random.rand(4)
-                new_weights[0] = abs(new_weights[0])
-                new_weights[1] = abs(new_weights[1])
-                new_weights[2] = -abs(new_weights[2])
-                new_weights[3] = -abs(new_weights[3])
+            # Random restart every iterations/50 steps (never for runs shorter than 50 iterations)
+            restart_interval = int(iterations / 50)
+            if restart_interval and i % restart_interval == 0 and i != 0:
+                new_weights = self.signs * np.abs(2 * np.random.rand(len(self.weights)))
                 self.weights = new_weights
                 print('new weights')
             
             new_score = self.objective_function(new_weights)
             
             # Calculate acceptance probability
-            delta_score = new_score - best_score
+            delta_score = new_score - self.best_score
             acceptance_probability = math.exp(delta_score / self.temperature) if delta_score < 0 else 1
             
             # Decide whether to accept the new weights
-            if random.random() < acceptance_probability:
+            if self.rng.random() < acceptance_probability:
                 self.weights = new_weights
-                best_weights = new_weights if new_score > best_score else best_weights
-                best_score = new_score if new_score > best_score else best_score
+                self.best_weights = new_weights if new_score > self.best_score else self.best_weights
+                self.best_stats = self.last_stats if new_score > self.best_score else self.best_stats
+                self.best_score = new_score if new_score > self.best_score else self.best_score
             
             # Cool down the temperature
             self.temperature *= self.cooling_rate
 
-            print(f"Iteration {i+1}, Best Score: {best_score}, Weights: {best_weights} || {self.weights} || {acceptance_probability}")
+            print(f"Iteration {i+1}, Best Score: {self.best_score}, Weights: {self.best_weights} || {self.weights} || {acceptance_probability}")
+
+            self.iteration = i + 1
+            if checkpoint_path and (self.iteration % checkpoint_every == 0 or self.iteration == iterations):
+                save_checkpoint(checkpoint_path, self.get_state())
+
+        return self.best_weights, self.best_score
+
+class CMAESOptimizer:
+    """Covariance Matrix Adaptation Evolution Strategy over the agent's weights.
+
+    Every generation of candidates is played in a single batch of games, so all
+    of them are scored concurrently by the evaluator's worker pool. All
+    candidates of a generation play the same piece sequences, which makes
+    their ranking less noisy."""
+
+    def __init__(self, evaluator: GameEvaluator, initial_weights, sigma=0.3, population_size=None,
+                 games_per_evaluation=5, seed=None, results_log: ResultsLog = None, common_seeds=False,
+                 cache: ResultCache = None, max_games=None, scoring='lines'):
+        self.evaluator = evaluator
+        self.service = EvaluationService(evaluator, cache, scoring=scoring)
+        self.games_per_evaluation = games_per_evaluation
+        # Adaptive sampling up to max_games per candidate, as in SimulatedAnnealingOptimizer
+        self.max_games = max(max_games or games_per_evaluation, games_per_evaluation)
+        self.results_log = results_log
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
+        # Seeds shared by every generation, instead of fresh ones per generation
+        self.game_seeds = draw_game_seeds(self.rng, self.max_games) if common_seeds else None
+
+        n = len(initial_weights)
+        self.mean = np.array(initial_weights, dtype=float)
+        self.sigma = sigma
+        self.population_size = population_size or 4 + int(3 * math.log(n))
+        self.parents = self.population_size // 2
+
+        # Recombination weights of the best half of each generation
+        recombination = math.log(self.parents + 0.5) - np.log(np.arange(1, self.parents + 1))
+        self.recombination_weights = recombination / recombination.sum()
+        self.mueff = 1 / np.sum(self.recombination_weights ** 2)
+
+        # Adaptation rates (defaults from Hansen's CMA-ES tutorial)
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2) ** 2 + self.mueff))
+        self.damps = 1 + 2 * max(0, math.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chi_n = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+        self.covariance = np.eye(n)
+        self.path_c = np.zeros(n)
+        self.path_sigma = np.zeros(n)
+        self.generation = 0
+        self.best_weights = self.mean
+        self.best_score = -float('inf')
+        self.best_stats = None
+        self.last_stats = None
+
+    def evaluate_population(self, population):
+        """Play the same seeded games with every candidate and return their average scores."""
+        seeds = self.game_seeds or draw_game_seeds(self.rng, self.max_games)
+        if self.max_games > self.games_per_evaluation:
+            stats = self.service.evaluate_adaptive(population, seeds, self.games_per_evaluation, self.best_stats)
+        else:
+            stats = self.service.evaluate(population, seeds)
+        for weights, candidate_stats in zip(population, stats):
+            log_evaluation(self.results_log, 'cmaes', self.generation, weights, candidate_stats)
+        self.last_stats = stats
+        return np.array([candidate_stats.mean for candidate_stats in stats])
+
+    def get_state(self):
+        """Return everything needed to resume the run exactly, including RNG states."""
+        return {
+            'algorithm': 'cmaes',
+            'iteration': self.generation,
+            'mean': self.mean,
+            'sigma': self.sigma,
+            'covariance': self.covariance,
+            'path_c': self.path_c,
+            'path_sigma': self.path_sigma,
+            'best_weights': self.best_weights,
+            'best_score': self.best_score,
+            'best_stats': self.best_stats,
+            'game_seeds': self.game_seeds,
+            'rng_state': self.rng.getstate(),
+            'np_rng_state': self.np_rng.bit_generator.state,
+        }
 
-        return best_weights, best_score
+    def set_state(self, state):
+        self.generation = state['iteration']
+        self.mean = state['mean']
+        self.sigma = state['sigma']
+        self.covariance = state['covariance']
+        self.path_c = state['path_c']
+        self.path_sigma = state['path_sigma']
+        self.best_weights = state['best_weights']
+        self.best_score = state['best_score']
+        self.best_stats = state.get('best_stats')
+        self.game_seeds = state['game_seeds']
+        self.rng.setstate(state['rng_state'])
+        self.np_rng.bit_generator.state = state['np_rng_state']
+
+    def step(self):
+        """Sample, score and select one generation. Returns (population, scores)."""
+        n = len(self.mean)
+        eigenvalues, basis = np.linalg.eigh(self.covariance)
+        scales = np.sqrt(np.maximum(eigenvalues, 1e-20))
+
+        steps = self.np_rng.standard_normal((self.population_size, n)) @ (basis * scales).T
+        population = self.mean + self.sigma * steps
+        scores = self.evaluate_population(list(population))
+
+        # Maximizing: the best candidates come first
+        order = np.argsort(-scores, kind='stable')[:self.parents]
+        step_mean = self.recombination_weights @ steps[order]
+        self.mean = self.mean + self.sigma * step_mean
+
+        # Update the evolution paths
+        inverse_sqrt = basis @ np.diag(1 / scales) @ basis.T
+        self.path_sigma = ((1 - self.cs) * self.path_sigma
+                           + math.sqrt(self.cs * (2 - self.cs) * self.mueff) * (inverse_sqrt @ step_mean))
+        self.generation += 1
+        norm = np.linalg.norm(self.path_sigma) / math.sqrt(1 - (1 - self.cs) ** (2 * self.generation))
+        hsig = norm / self.chi_n < 1.4 + 2 / (n + 1)
+        self.path_c = (1 - self.cc) * self.path_c + hsig * math.sqrt(self.cc * (2 - self.cc) * self.mueff) * step_mean
+
+        # Adapt the covariance matrix and step size
+        rank_mu = (steps[order].T * self.recombination_weights) @ steps[order]
+        self.covariance = (
+            (1 - self.c1 - self.cmu) * self.covariance
+            + self.c1 * (np.outer(self.path_c, self.path_c) + (1 - hsig) * self.cc * (2 - self.cc) * self.covariance)
+            + self.cmu * rank_mu
+        )
+        self.covariance = (self.covariance + self.covariance.T) / 2
+        self.sigma *= math.exp((self.cs / self.damps) * (np.linalg.norm(self.path_sigma) / self.chi_n - 1))
+
+        return population, scores
+
+    def optimize(self, iterations=100, checkpoint_path=None, checkpoint_every=10):
+        for i in range(self.generation, iterations):
+            population, scores = self.step()
+            best = int(np.argmax(scores))
+            if scores[best] > self.best_score:
+                self.best_score = scores[best]
+                self.best_weights = population[best]
+                self.best_stats = self.last_stats[best]
+
+            print(f"Generation {i+1}, Best Score: {self.best_score}, Weights: {self.best_weights} || Mean: {self.mean} || Sigma: {self.sigma}")
+
+            if checkpoint_path and (self.generation % checkpoint_every == 0 or self.generation == iterations):
+                save_checkpoint(checkpoint_path, self.get_state())
+
+        return self.best_weights, self.best_score
 
 # Usage example
 if __name__ == "__main__":
-    # Initialize the Tetris environment and agent
-    env = TetrisEnv()
-    agent = TetrisAgent(env, is_debug=False)
-    
-    # Initial weights for [lines_cleared, holes, height, empty_pillars_penalty]
-    initial_weights = [0.19084932741423177, 0.6299980219054631, -0.0229841425115187, -0.9764034410377012]
+    parser = argparse.ArgumentParser(description="Optimize the Tetris agent's weights.")
+    parser.add_argument('--algorithm', choices=['annealing', 'cmaes'], default='annealing')
+    parser.add_argument('--iterations', type=int, default=None,
+                        help="annealing iterations or CMA-ES generations (default 1500 / 100)")
+    parser.add_argument('--population', type=int, default=None, help="CMA-ES candidates per generation")
+    parser.add_argument('--games', type=int, default=5, help="games played per weight vector")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes playing games")
+    parser.add_argument('--seed', type=int, default=None, help="seed for a reproducible run")
+    parser.add_argument('--common-seeds', action='store_true',
+                        help="play every weight vector on the same seeded games (common random numbers)")
+    parser.add_argument('--randomizer', choices=['uniform', 'bag'], default='uniform', help="piece randomizer")
+    parser.add_argument('--checkpoint', default=None, help="file to periodically save the optimizer state to")
+    parser.add_argument('--checkpoint-every', type=int, default=10, help="iterations between checkpoints")
+    parser.add_argument('--resume', action='store_true', help="continue the run saved in --checkpoint")
+    parser.add_argument('--results-log', default=None, help="JSONL file to append every evaluated weight vector to")
+    parser.add_argument('--max-games', type=int, default=None,
+                        help="play up to this many games per weight vector while it is too close to the best to rank")
+    parser.add_argument('--cache', default=None, help="file caching game results between runs")
+    parser.add_argument('--cache-size', type=int, default=100_000, help="games kept in the result cache")
+    parser.add_argument('--max-pieces', type=int, default=None, help="end each game after this many pieces")
+    parser.add_argument('--max-lines', type=int, default=None, help="end each game after this many lines")
+    parser.add_argument('--time-limit', type=float, default=None, help="end each game after this many seconds")
+    parser.add_argument('--profile', action='store_true', help="time the games played and print a summary")
+    parser.add_argument('--scoring', choices=['lines', 'lines_per_piece'], default='lines',
+                        help="game score; lines_per_piece stays comparable when caps cut games short")
+    parser.add_argument('--features', default=','.join(DEFAULT_FEATURES),
+                        help=f"comma-separated features the agent's evaluator weighs, from: {', '.join(FEATURES)}")
+    args = parser.parse_args()
+    if args.resume and not args.checkpoint:
+        parser.error("--resume requires --checkpoint")
+    features = tuple(name.strip() for name in args.features.split(',') if name.strip())
+    unknown = [name for name in features if name not in FEATURES]
+    if unknown or not features:
+        parser.error(f"unknown --features: {', '.join(unknown) or '(none)'}")
+
+    if features == DEFAULT_FEATURES:
+        # Initial weights for [lines_cleared, holes, height, empty_pillars_penalty]
+        initial_weights = [0.19084932741423177, 0.6299980219054631, -0.0229841425115187, -0.9764034410377012]
+    else:
+        initial_weights = default_weights(features)
+    print(f"Features: {', '.join(features)}")
+
+    results_log = ResultsLog(args.results_log) if args.results_log else None
+    cache = ResultCache(args.cache, max_entries=args.cache_size)
 
     # Create optimizer and start optimization
-    optimizer = SimulatedAnnealingOptimizer(agent, initial_weights)
-    best_weights, best_score = optimizer.optimize()
+    with GameEvaluator(workers=args.workers, randomizer=args.randomizer, max_pieces=args.max_pieces,
+                       max_lines=args.max_lines, time_limit=args.time_limit, profile=args.profile,
+                       features=features) as evaluator:
+        if args.algorithm == 'cmaes':
+            optimizer = CMAESOptimizer(evaluator, initial_weights, population_size=args.population,
+                                       games_per_evaluation=args.games, seed=args.seed, results_log=results_log,
+                                       common_seeds=args.common_seeds, cache=cache, max_games=args.max_games,
+                                       scoring=args.scoring)
+            iterations = args.iterations or 100
+        else:
+            optimizer = SimulatedAnnealingOptimizer(evaluator, initial_weights, games_per_evaluation=args.games,
+                                                    seed=args.seed, results_log=results_log,
+                                                    common_seeds=args.common_seeds, cache=cache,
+                                                    max_games=args.max_games, scoring=args.scoring)
+            iterations = args.iterations or 1500
+
+        if args.resume:
+            state = load_checkpoint(args.checkpoint)
+            if state['algorithm'] != args.algorithm:
+                parser.error(f"checkpoint is for --algorithm {state['algorithm']}")
+            optimizer.set_state(state)
+            print(f"Resuming from iteration {optimizer.get_state()['iteration']}")
+
+        best_weights, best_score = optimizer.optimize(iterations=iterations, checkpoint_path=args.checkpoint,
+                                                      checkpoint_every=args.checkpoint_every)
+        if evaluator.profiler is not None:
+            print(evaluator.profiler.summary())
+
+    if results_log is not None:
+        results_log.close()
+    cache.close()
 
-    
     print("Best Weights:", best_weights)
     print("Best Score:", best_score)
-
-    env.close()
\ No newline at end of file
+    if optimizer.best_stats is not None:
+        stats = optimizer.best_stats
+        print(f"Best Score CI: [{stats.ci_low:.1f}, {stats.ci_high:.1f}] over {stats.games} games "
+              f"({stats.censored} censored), {stats.pieces} pieces")
+    print(f"Games played: {optimizer.service.games_played} | cache hits: {cache.hits}")
\ No newline at end of file
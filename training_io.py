@@ -0,0 +1,44 @@
+import json
+import os
+import pickle
+import time
+import numpy as np
+
+
+def save_checkpoint(path, state):
+    """Write an optimizer state dict to path.
+
+    The file is replaced atomically, so a crash while writing keeps the previous checkpoint."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ResultsLog:
+    """Append-only JSONL file with one record per evaluated weight vector."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a')
+
+    def write(self, **record):
+        record.setdefault('time', time.time())
+        self.file.write(json.dumps(record, default=_to_json) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
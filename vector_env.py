@@ -0,0 +1,223 @@
+import argparse
+import time
+import numpy as np
+import batch_evaluator
+from tetris_core import PieceRandomizer, TetrisGame
+from tetris_pieces import PIECES, ROTATIONS
+from tetris_agent import TetrisAgent
+
+PIECE_NAMES = list(PIECES)
+
+
+class VectorTetrisEnv:
+    """K independent Tetris games advanced together, one placement per game per call.
+
+    The boards live in one (K, height, width) array, so placing pieces,
+    clearing lines and detecting game over are array operations across all
+    games. Each game has its own seedable piece sequence, drawn exactly like
+    TetrisGame's. With auto_reset, a finished game is recorded in
+    completed_games and its slot starts a new game right away."""
+
+    def __init__(self, num_games, board_width=10, board_height=20, randomizer='uniform', auto_reset=True):
+        self.num_games = num_games
+        self.board_width = board_width
+        self.board_height = board_height
+        self.auto_reset = auto_reset
+
+        self.boards = np.zeros((num_games, board_height, board_width), dtype=np.int8)
+        self.randomizers = [PieceRandomizer(PIECE_NAMES, randomizer) for _ in range(num_games)]
+        self.current_piece_names = [None] * num_games
+        self.next_piece_names = [None] * num_games
+        self.lines_cleared_count = np.zeros(num_games, dtype=int)
+        self.pieces_placed = np.zeros(num_games, dtype=int)
+        self.done = np.zeros(num_games, dtype=bool)
+        # (slot, lines_cleared_count, pieces_placed) of every finished game, in finishing order
+        self.completed_games = []
+
+        # Precomputed rotations of every piece, shared with TetrisGame
+        self.rotations = ROTATIONS
+
+        self.reset()
+
+    def reset(self, seeds=None):
+        """Start a new game in every slot; seeds gives one piece-sequence seed per slot."""
+        self.completed_games = []
+        for slot in range(self.num_games):
+            self.reset_game(slot, None if seeds is None else seeds[slot])
+
+    def reset_game(self, slot, seed=None):
+        self.boards[slot] = 0
+        self.randomizers[slot].reset(seed)
+        self.lines_cleared_count[slot] = 0
+        self.pieces_placed[slot] = 0
+        self.done[slot] = False
+        self.next_piece_names[slot] = None
+        self.spawn_piece(slot)
+
+    def spawn_piece(self, slot):
+        randomizer = self.randomizers[slot]
+        self.current_piece_names[slot] = self.next_piece_names[slot] or randomizer.draw()
+        self.next_piece_names[slot] = randomizer.draw()
+
+    def place(self, rotations, cols):
+        """Place every running game's current piece with the given rotation and column.
+
+        Same rules as TetrisGame.place: at the spawn position the piece is
+        rotated, then shifted towards the column, each move only while it
+        fits, then hard dropped. Locks the pieces, clears lines, spawns the
+        next pieces and returns (lines_cleared, done) arrays for this call."""
+        active = np.nonzero(~self.done)[0]
+        cols = np.asarray(cols)
+        board_cols = np.arange(-1, self.board_width)
+
+        # Rotate at the spawn position: a rotation that does not fit stops the rest
+        achieved = {}
+        for name in set(self.current_piece_names[slot] for slot in active):
+            slots = np.array([slot for slot in active if self.current_piece_names[slot] == name])
+            spawn_col = np.array([self.board_width // 2 - self.rotations[name][0].width // 2])
+            wanted = np.asarray(rotations)[slots] % 4
+            rotation = np.zeros(len(slots), dtype=int)
+            rotating = np.ones(len(slots), dtype=bool)
+            for step in range(1, 4):
+                rotating &= (wanted >= step) & self.fits_at_top(slots, self.rotations[name][step], spawn_col)[:, 0]
+                rotation[rotating] = step
+            for step in np.unique(rotation):
+                achieved[(name, step)] = (slots[rotation == step], spawn_col[0])
+
+        for (name, rotation), (slots, spawn_col) in achieved.items():
+            piece = self.rotations[name][rotation]
+
+            # Shift towards the target column while the piece fits at the top
+            fits = self.fits_at_top(slots, piece, board_cols)
+            spawn_index = spawn_col + 1
+            fits_right = np.cumprod(fits[:, spawn_index:], axis=1).sum(axis=1)
+            fits_left = np.cumprod(fits[:, spawn_index::-1], axis=1).sum(axis=1)
+            slot_cols = np.clip(cols[slots], spawn_col - fits_left + 1, spawn_col + fits_right - 1)
+
+            # Hard drop and lock
+            piece_cols = piece.columns(self.board_width)
+            rows = batch_evaluator.landing_rows_many(self.boards[slots], piece, piece_cols)[
+                np.arange(len(slots)), slot_cols - piece_cols[0]]
+            cells_x = rows[:, None] + piece.cells_x
+            cells_y = slot_cols[:, None] + piece.cells_y
+            game = np.broadcast_to(slots[:, None], cells_x.shape)
+            inside = cells_x >= 0
+            self.boards[game[inside], cells_x[inside], cells_y[inside]] = 1
+        self.pieces_placed[active] += 1
+
+        lines_cleared = self.clear_lines()
+
+        for slot in active:
+            self.spawn_piece(slot)
+        done = np.zeros(self.num_games, dtype=bool)
+        done[active] = self.spawn_blocked(active)
+        self.done |= done
+
+        for slot in np.nonzero(done)[0]:
+            self.completed_games.append((int(slot), int(self.lines_cleared_count[slot]),
+                                         int(self.pieces_placed[slot])))
+            if self.auto_reset:
+                # The slot's piece sequence carries on into the new game
+                self.boards[slot] = 0
+                self.lines_cleared_count[slot] = 0
+                self.pieces_placed[slot] = 0
+                self.done[slot] = False
+                self.spawn_piece(slot)
+
+        return lines_cleared, done
+
+    def fits_at_top(self, slots, piece, cols):
+        """Return a (len(slots), len(cols)) mask of where the piece (a PieceRotation) fits with its top at row 0."""
+        cells_y = np.asarray(cols)[:, None] + piece.cells_y
+        inside = ((cells_y >= 0) & (cells_y < self.board_width)).all(axis=1)
+        fits = np.zeros((len(slots), len(cols)), dtype=bool)
+        fits[:, inside] = ~self.boards[np.asarray(slots)[:, None, None], piece.cells_x, cells_y[inside]].any(axis=2)
+        return fits
+
+    def clear_lines(self):
+        """Clear full lines on every board at once and return the lines cleared per game."""
+        full = self.boards.all(axis=2)
+        lines_cleared = full.sum(axis=1)
+        cleared = np.nonzero(lines_cleared)[0]
+        if len(cleared):
+            # Stable sort puts the full rows first and keeps the other rows in order below them
+            order = np.argsort(~full[cleared], axis=1, kind='stable')
+            boards = np.take_along_axis(self.boards[cleared], order[:, :, None], axis=1)
+            boards[np.arange(self.board_height) < lines_cleared[cleared, None]] = 0
+            self.boards[cleared] = boards
+            self.lines_cleared_count += lines_cleared
+        return lines_cleared
+
+    def spawn_blocked(self, slots):
+        """Return, for each slot, whether its new piece overlaps the stack at the spawn position."""
+        blocked = np.zeros(len(slots), dtype=bool)
+        names = [self.current_piece_names[slot] for slot in slots]
+        for name in set(names):
+            piece = self.rotations[name][0]
+            spawn_col = [self.board_width // 2 - piece.width // 2]
+            group = np.array([index for index, piece_name in enumerate(names) if piece_name == name])
+            blocked[group] = ~self.fits_at_top(np.asarray(slots)[group], piece, spawn_col)[:, 0]
+        return blocked
+
+
+def play_games_vectorized(agent: TetrisAgent, vector_env: VectorTetrisEnv, games, seeds=None):
+    """Play `games` games across the vector env's slots and return the lines each cleared, in game order.
+
+    The games are fixed in advance, game i with piece-sequence seed seeds[i].
+    A slot whose game ends starts the next game not started yet; once all
+    have started, the slots drain until every game has finished, so long
+    games count as much as short ones. Moves for all running slots are
+    chosen with one agent.choose_best_moves call per placement. The slots
+    are reset here, so the env's auto_reset is suspended meanwhile."""
+    seeds = [None] * games if seeds is None else list(seeds)
+    if len(seeds) != games:
+        raise ValueError(f"Got {len(seeds)} seeds for {games} games")
+    auto_reset = vector_env.auto_reset
+    vector_env.auto_reset = False
+    try:
+        vector_env.completed_games = []
+        game_of_slot = np.zeros(vector_env.num_games, dtype=int)
+        scores = [None] * games
+        started = 0
+        for slot in range(vector_env.num_games):
+            if started < games:
+                vector_env.reset_game(slot, seeds[started])
+                game_of_slot[slot] = started
+                started += 1
+            else:
+                vector_env.done[slot] = True
+
+        rotations = np.zeros(vector_env.num_games, dtype=int)
+        cols = np.zeros(vector_env.num_games, dtype=int)
+        while not vector_env.done.all():
+            active = np.nonzero(~vector_env.done)[0]
+            rows, rotations[active], cols[active] = agent.choose_best_moves(
+                vector_env.boards[active], [vector_env.current_piece_names[slot] for slot in active])
+            lines_cleared, done = vector_env.place(rotations, cols)
+            for slot in np.nonzero(done)[0]:
+                scores[game_of_slot[slot]] = int(vector_env.lines_cleared_count[slot])
+                if started < games:
+                    vector_env.reset_game(slot, seeds[started])
+                    game_of_slot[slot] = started
+                    started += 1
+    finally:
+        vector_env.auto_reset = auto_reset
+    return scores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play many Tetris games at once in a vectorized env.")
+    parser.add_argument('--games', type=int, default=100, help="number of games to play")
+    parser.add_argument('--slots', type=int, default=32, help="games played side by side")
+    parser.add_argument('--seed', type=int, default=None, help="game i is played with seed + i")
+    args = parser.parse_args()
+
+    vector_env = VectorTetrisEnv(args.slots)
+    agent = TetrisAgent(TetrisGame(), is_debug=False, backend='batch')
+    seeds = None if args.seed is None else [args.seed + game for game in range(args.games)]
+
+    start = time.perf_counter()
+    scores = play_games_vectorized(agent, vector_env, args.games, seeds)
+    elapsed = time.perf_counter() - start
+    pieces = sum(pieces for slot, lines, pieces in vector_env.completed_games)
+    print(f'Average score: {sum(scores) / len(scores)} | {elapsed:.2f}s | {pieces / elapsed:.0f} pieces/s')